@@ -0,0 +1,164 @@
+"""Measures end to end throughput of getData against a local mockServer.py, so changes
+to the fetch stage can be compared offline and reproducibly"""
+import argparse
+import contextlib
+import io
+import statistics
+import tempfile
+import threading
+import time
+
+from getData import getData
+from mockServer import MockAPIServer
+
+
+def benchmark(server, jobs, maxMetrics, repeat=3, warm=False):
+    """Returns the wall times of repeat full fetches and the server stats of the last.
+    If warm is set each fetch reuses the response cache of a previous one"""
+    times = []
+    with tempfile.TemporaryDirectory() as warmDir:
+        if warm:
+            runFetch(server, warmDir + "/", jobs, maxMetrics)
+
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as coldDir:
+                dataDir = (warmDir if warm else coldDir) + "/"
+                server.resetStats()
+
+                start = time.perf_counter()
+                runFetch(server, dataDir, jobs, maxMetrics)
+                times.append(time.perf_counter() - start)
+
+    return times, server.stats
+
+
+def runFetch(server, dataDir, jobs, maxMetrics):
+    # the progress bar and messages would swamp the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        getData(
+            dataDir,
+            force=True,
+            jobs=jobs,
+            rate=0,
+            full=True,
+            maxMetrics=maxMetrics,
+            apiRoot=server.url(),
+        )
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "-F",
+        "--fixturesDir",
+        help="Directory of recorded responses [default: fixtures/]",
+        default="fixtures/",
+        type=str,
+    )
+
+    parser.add_argument(
+        "-D",
+        "--dataDir",
+        help="Build responses without a fixture from the CSVs in this directory "
+        + "[default: data/]",
+        default="data/",
+        type=str,
+    )
+
+    parser.add_argument(
+        "-l",
+        "--latency",
+        help="Seconds added to every response [default: 0.1]",
+        default=0.1,
+        type=float,
+    )
+
+    parser.add_argument(
+        "-b",
+        "--bandwidth",
+        help="Bytes per second of each response, 0 for no limit [default: 0]",
+        default=0,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--tooManyRequests",
+        help="Fraction of requests answered with a 429 [default: 0]",
+        default=0,
+        type=float,
+    )
+
+    parser.add_argument(
+        "-z",
+        "--gzip",
+        help="Gzip responses, measuring compressed transfer",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Worker counts to compare [default: 1 8]",
+        default=[1, 8],
+        nargs="+",
+        type=int,
+    )
+
+    parser.add_argument(
+        "-m",
+        "--maxMetrics",
+        help="Metrics per request to compare [default: 1 5]",
+        default=[1, 5],
+        nargs="+",
+        type=int,
+    )
+
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        help="Number of fetches per configuration [default: 3]",
+        default=3,
+        type=int,
+    )
+
+    parser.add_argument(
+        "-w",
+        "--warm",
+        help="Keep the response cache between fetches, measuring conditional requests",
+        action="store_true",
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    server = MockAPIServer(
+        ("127.0.0.1", 0),
+        clArgs.fixturesDir,
+        clArgs.latency,
+        clArgs.bandwidth,
+        clArgs.tooManyRequests,
+        dataDir=clArgs.dataDir,
+        compress=clArgs.gzip,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print("jobs  metrics  requests       MB  median s     MB/s")
+    for maxMetrics in clArgs.maxMetrics:
+        for jobs in clArgs.jobs:
+            times, stats = benchmark(server, jobs, maxMetrics, clArgs.repeat, clArgs.warm)
+            median = statistics.median(times)
+            megabytes = stats["bytes"] / 1024 / 1024
+            print(
+                "%4d  %7d  %8d  %7.2f  %8.2f  %7.2f"
+                % (jobs, maxMetrics, stats["requests"], megabytes, median, megabytes / median)
+            )
+
+    server.shutdown()
@@ -0,0 +1,273 @@
+"""Columnar store of daily values keyed by area, metric and date. Each year is one
+memory-mapped float64 array of shape (metrics, areas, 366) with NaN for days without
+data, so reading a series is a slice of the mapped file rather than a CSV parse"""
+import argparse
+import copy
+import csv
+import json
+import os
+
+import numpy as np
+
+from manifest import writeAtomic
+
+storeCache = {}
+
+
+def openStore(storeDir):
+    """Returns the metadata and the memory-mapped partition of each year, reopening
+    them only if the store has been rewritten"""
+    metaFile = os.path.join(storeDir, "meta.json")
+    mtime = os.stat(metaFile).st_mtime_ns
+
+    cached = storeCache.get(storeDir)
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+
+    with open(metaFile) as file:
+        meta = json.load(file)
+
+    partitions = {
+        year: np.load(os.path.join(storeDir, "%d.npy" % year), mmap_mode="r")
+        for year in meta["years"]
+    }
+
+    storeCache[storeDir] = (mtime, meta, partitions)
+    return meta, partitions
+
+
+def readMetric(storeDir, metric, area, start=None, end=None):
+    """Returns the first date and the daily values of metric for area from start to end
+    inclusive, which default to the first and last days with data. Reads within one
+    year are views of the mapped partition, longer ones are concatenated"""
+    meta, partitions = openStore(storeDir)
+
+    bounds = meta["bounds"].get(metric, {}).get(area)
+    if bounds is None:
+        return None, np.empty(0)
+
+    start = np.datetime64(start or bounds[0], "D")
+    end = np.datetime64(end or bounds[1], "D")
+
+    m = meta["metrics"].index(metric)
+    a = meta["areas"].index(area)
+
+    slices = []
+    for year in range(yearOf(start), yearOf(end) + 1):
+        first = max(start, np.datetime64("%d-01-01" % year, "D"))
+        last = min(end, np.datetime64("%d-12-31" % year, "D"))
+        offset = dayOfYear(first)
+        length = (last - first).astype(int) + 1
+
+        if year in partitions:
+            slices.append(partitions[year][m, a, offset : offset + length])
+        else:
+            slices.append(np.full(length, np.nan))
+
+    if len(slices) == 1:
+        return start, slices[0]
+    return start, np.concatenate(slices)
+
+
+def readDates(storeDir, metric, area, skip=0):
+    """Returns the dates and values of the days with data, dropping the last skip. The
+    values are a view of readMetric's if the days with data are contiguous"""
+    start, values = readMetric(storeDir, metric, area)
+    if start is None:
+        return np.empty(0, dtype="datetime64[D]"), values
+    present = np.flatnonzero(~np.isnan(values))
+    if skip:
+        present = present[:-skip]
+    return start + present, values[asSlice(present)]
+
+
+def writeMetrics(storeDir, series):
+    """Replaces the stored values of each (metric, area) in series, a dict of
+    (metric, area): (start, values) where values are daily from start with NaN for days
+    without data. Partitions are written to temporary files and renamed into place so
+    that readers holding the old mappings are unaffected"""
+    os.makedirs(storeDir, exist_ok=True)
+    metaFile = os.path.join(storeDir, "meta.json")
+
+    meta = {"metrics": [], "areas": [], "years": [], "bounds": {}}
+    partitions = {}
+    if os.path.isfile(metaFile):
+        meta, mapped = openStore(storeDir)
+        meta = copy.deepcopy(meta)
+        partitions = {year: np.array(array) for year, array in mapped.items()}
+
+    for (metric, area), (start, values) in series.items():
+        if metric not in meta["metrics"]:
+            meta["metrics"].append(metric)
+        if area not in meta["areas"]:
+            meta["areas"].append(area)
+
+    shape = (len(meta["metrics"]), len(meta["areas"]), 366)
+    for year, array in partitions.items():
+        if array.shape != shape:
+            grown = np.full(shape, np.nan)
+            grown[: array.shape[0], : array.shape[1]] = array
+            partitions[year] = grown
+
+    for (metric, area), (start, values) in series.items():
+        m = meta["metrics"].index(metric)
+        a = meta["areas"].index(area)
+
+        for array in partitions.values():
+            array[m, a] = np.nan
+
+        present = np.flatnonzero(~np.isnan(values))
+        if len(present) == 0:
+            meta["bounds"].setdefault(metric, {}).pop(area, None)
+            continue
+
+        start = np.datetime64(start, "D")
+        dates = start + present
+        yearStarts = dates.astype("datetime64[Y]")
+        years = yearStarts.astype(int) + 1970
+        offsets = (dates - yearStarts.astype("datetime64[D]")).astype(int)
+
+        for year in np.unique(years):
+            year = int(year)
+            if year not in partitions:
+                partitions[year] = np.full(shape, np.nan)
+            inYear = years == year
+            partitions[year][m, a, offsets[inYear]] = values[present[inYear]]
+
+        meta["bounds"].setdefault(metric, {})[area] = [str(dates[0]), str(dates[-1])]
+
+    meta["years"] = sorted(partitions)
+
+    for year, array in partitions.items():
+        fileName = os.path.join(storeDir, "%d.npy" % year)
+        with open(fileName + ".tmp", "wb") as file:
+            np.save(file, array)
+        os.replace(fileName + ".tmp", fileName)
+
+    writeAtomic(metaFile, json.dumps(meta))
+
+    storeCache.pop(storeDir, None)
+
+
+def importCSVs(dataDir, storeDir, areas, names):
+    """Copies the dataDir/<area>.<name>.csv files into the store, keeping the first
+    value column as readData does. Empty values are stored as 0"""
+    series = {}
+    for area in areas:
+        for name in names:
+            fileName = dataDir + area + "." + name + ".csv"
+            if not os.path.isfile(fileName):
+                continue
+
+            with open(fileName) as file:
+                rows = [line for line in csv.reader(file) if line]
+            if not rows:
+                continue
+
+            dates = np.array([line[0] for line in rows], dtype="datetime64[D]")
+            values = np.array([float(line[1] or 0) for line in rows])
+            series[name, area] = toDaily(dates, values)
+
+    writeMetrics(storeDir, series)
+
+
+def importData(dataDir, storeDir):
+    """Copies every file fetched by getData, and the excess deaths, into the store"""
+    from getData import metrics
+
+    areas = ["UK", "Scotland", "England", "Northern Ireland", "Wales"]
+    importCSVs(dataDir, storeDir, areas, list(metrics) + ["deaths.excess"])
+
+
+def frameSeries(prefix, area, frame):
+    """The series writeMetrics stores for a daily indexed DataFrame, each column as
+    metric prefix + column along with prefix + "rows" marking the dates in the index"""
+    dates = frame.index.values.astype("datetime64[D]")
+    series = {(prefix + "rows", area): toDaily(dates, np.ones(len(dates)))}
+    for column in frame.columns:
+        series[prefix + column, area] = toDaily(dates, frame[column].values)
+    return series
+
+
+def readFrame(storeDir, prefix, area, columns=None):
+    """Inverse of frameSeries, returns a DataFrame indexed by date of columns, by default
+    every column stored under prefix. Columns are views as in readDates"""
+    import pandas as pd
+
+    if columns is None:
+        meta, _ = openStore(storeDir)
+        columns = [
+            metric[len(prefix) :]
+            for metric in meta["metrics"]
+            if metric.startswith(prefix) and "." not in metric[len(prefix) :]
+        ]
+        columns.remove("rows")
+
+    start, rows = readMetric(storeDir, prefix + "rows", area)
+    end = start + len(rows) - 1
+    present = np.flatnonzero(~np.isnan(rows))
+    days = asSlice(present)
+
+    data = {}
+    for column in columns:
+        _, values = readMetric(storeDir, prefix + column, area, start, end)
+        data[column] = values[days]
+
+    index = pd.DatetimeIndex((start + present).astype("datetime64[ns]"))
+    return pd.DataFrame(data, index=index, copy=False)
+
+
+def asSlice(indices):
+    """indices as a slice if they are a contiguous range, so indexing with them returns
+    a view rather than a copy"""
+    if len(indices) and indices[-1] - indices[0] == len(indices) - 1:
+        return slice(indices[0], indices[-1] + 1)
+    return indices
+
+
+def toDaily(dates, values):
+    """Spreads values onto a daily axis from the first date, NaN where there is no
+    date"""
+    offsets = (dates - dates[0]).astype(int)
+    daily = np.full(offsets[-1] + 1, np.nan)
+    daily[offsets] = values
+    return dates[0], daily
+
+
+def yearOf(date):
+    return int(date.astype("datetime64[Y]").astype(int)) + 1970
+
+
+def dayOfYear(date):
+    return int((date - date.astype("datetime64[Y]").astype("datetime64[D]")).astype(int))
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "-D",
+        "--dataDir",
+        help="Directory where the csv files are stored [default: data/]",
+        default="data/",
+        type=str,
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    storeDir = clArgs.dataDir + "store/"
+    importData(clArgs.dataDir, storeDir)
+
+    meta, partitions = openStore(storeDir)
+    print(
+        "%d metrics, %d areas, years %s"
+        % (len(meta["metrics"]), len(meta["areas"]), ", ".join(map(str, meta["years"])))
+    )
@@ -0,0 +1,49 @@
+"""Aligns daily series on one axis of day ordinals, so that series covering different
+dates are combined by offsetting into a preallocated array rather than by joining
+their indexes"""
+import numpy as np
+import pandas as pd
+
+
+def align(series):
+    """series is a list of (dates, values) pairs with datetime64[D] dates. Returns the
+    first date, a float64 array of shape (len(series), days) with NaN where a series has
+    no value and a boolean array marking the days on which any series has a value"""
+    bounds = [(dates.min(), dates.max()) for dates, _ in series if len(dates)]
+    if not bounds:
+        return None, np.empty((len(series), 0)), np.empty(0, dtype=bool)
+
+    first = min(start for start, _ in bounds)
+    last = max(end for _, end in bounds)
+    days = int((last - first).astype(np.int64)) + 1
+
+    table = np.full((len(series), days), np.nan)
+    present = np.zeros(days, dtype=bool)
+
+    for row, (dates, values) in enumerate(series):
+        if not len(dates):
+            continue
+
+        offsets = (dates - first).astype(np.int64)
+        start, end = offsets[0], offsets[-1] + 1
+
+        # daily series are one slice, sparse ones such as weekly data are scattered
+        if end - start == len(offsets) and (np.diff(offsets) == 1).all():
+            table[row, start:end] = values
+            present[start:end] = True
+        else:
+            table[row, offsets] = values
+            present[offsets] = True
+
+    return first, table, present
+
+
+def toFrame(first, table, present, names):
+    """DataFrame of the aligned series, with a row for each day on which any has a
+    value"""
+    if first is None:
+        return pd.DataFrame(columns=names, dtype=np.float64)
+
+    offsets = np.flatnonzero(present)
+    index = pd.DatetimeIndex((first + offsets).astype("datetime64[ns]"))
+    return pd.DataFrame(table[:, offsets].T, index=index, columns=names)
@@ -0,0 +1,136 @@
+"""Registry of metrics derived from the data. Derived metrics are declared by the
+metrics they depend on, and transforms of frames of areas by days by name. A
+MetricCache evaluates each metric with its transforms lazily once, and metricCache
+shares one MetricCache per data source for the rest of the run"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from rollingKernels import rollingMean
+
+populations = {
+    "England": 56550138,
+    "Northern Ireland": 1895510,
+    "Scotland": 5466000,
+    "Wales": 3169586,
+}
+populations["UK"] = sum(populations.values())
+
+# name: (dependencies, function of the dependency series)
+derived = {}
+
+# name: function of a frame with a column per area and any arguments
+transforms = {}
+
+# key: MetricCache, so every caller with the same source shares results
+caches = {}
+cachesLock = threading.Lock()
+
+
+def derive(name, *dependencies):
+    """Registers a metric computed from other metrics of the same area"""
+
+    def register(function):
+        derived[name] = (dependencies, function)
+        return function
+
+    return register
+
+
+def transform(name):
+    """Registers a transform that can be applied to any frame of areas by days"""
+
+    def register(function):
+        transforms[name] = function
+        return function
+
+    return register
+
+
+class MetricCache:
+    """load(metric) returns a metric that isn't derived, a Series of one area or a
+    frame of areas by days. Metrics are requested as get(metric, *transforms) where
+    each transform is a name or a tuple of a name and its arguments, applied in order"""
+
+    def __init__(self, load):
+        self.load = load
+        self.values = {}
+        self.lock = threading.RLock()
+
+    def get(self, metric, *steps):
+        steps = tuple(step if isinstance(step, tuple) else (step,) for step in steps)
+        key = (metric, steps)
+
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = self.evaluate(metric, steps)
+            return self.values[key]
+
+    def evaluate(self, metric, steps):
+        if steps:
+            name, *args = steps[-1]
+            return transforms[name](self.get(metric, *steps[:-1]), *args)
+
+        if metric in derived:
+            dependencies, function = derived[metric]
+            return function(*[self.get(name) for name in dependencies])
+
+        return self.load(metric)
+
+
+def metricCache(key, load):
+    """Returns the MetricCache of key, creating it with load the first time"""
+    with cachesLock:
+        if key not in caches:
+            caches[key] = MetricCache(load)
+        return caches[key]
+
+
+def percentage(numerator, denominator):
+    """numerator / denominator * 100 capped at 100. Division by zero gives 100, or NaN
+    for 0 / 0, and NaN in either gives NaN"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = numerator.to_numpy(float) / denominator.to_numpy(float) * 100
+    return pd.Series(np.minimum(ratio, 100), index=numerator.index)
+
+
+@derive("posTests", "reportedCases", "reportedTests")
+def posTests(reportedCases, reportedTests):
+    return percentage(reportedCases, reportedTests)
+
+
+@derive("mortCases", "reportedCases")
+def mortCases(reportedCases):
+    return reportedCases.rolling(28).sum()
+
+
+@derive("mortality", "specimenDeaths", "mortCases")
+def mortality(specimenDeaths, mortCases):
+    return percentage(specimenDeaths, mortCases)
+
+
+@derive("hospitalisationRate", "hospitalisations", "mortCases")
+def hospitalisationRate(hospitalisations, mortCases):
+    return percentage(hospitalisations, mortCases)
+
+
+@transform("rolling")
+def rolling(frame, n=7):
+    """Mean of each day and the n - 1 before it, from the first day of each area"""
+    table = frame.to_numpy().T
+    means = np.where(np.isnan(table), np.nan, rollingMean(table, n, nan="omit"))
+    return pd.DataFrame(means.T, index=frame.index, columns=frame.columns)
+
+
+@transform("perCapita")
+def perCapita(frame, populationArea=None):
+    """Percent of the population of each area, or of populationArea if given"""
+    population = [populations[populationArea or area] for area in frame.columns]
+    return frame / np.array(population, float) * 100
+
+
+@transform("cumulative")
+def cumulative(frame):
+    """Running totals, with NaN counted as 0"""
+    return frame.fillna(0).cumsum()
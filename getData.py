@@ -1,15 +1,75 @@
 import argparse
 import os
+import random
 import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm.rich import tqdm
 
 from datetime import timedelta, date
+from email.utils import parsedate_to_datetime
+
+from httpCache import HTTPCache
+from manifest import Manifest, writeAtomic
+from responseArchive import ResponseArchive
+from vintageStore import VintageStore
+
+
+# the API metrics making up each file
+metrics = {
+    "testing.reported": [
+        "newPillarOneTestsByPublishDate",
+        "newPillarTwoTestsByPublishDate",
+        "newPillarFourTestsByPublishDate",
+    ],
+    "cases": ["newCasesBySpecimenDate"],
+    "cases.reported": ["newCasesByPublishDate"],
+    "deaths": ["newDeaths28DaysByDeathDate"],
+    "deaths.reported": ["newDeaths28DaysByPublishDate"],
+    "deaths.onCertificate": ["newDailyNsoDeathsByDeathDate"],
+    "hospitalisations": ["newAdmissions"],
+    "inHospital": ["hospitalCases"],
+    "vaccinations.weekly": [
+        "weeklyPeopleVaccinatedFirstDoseByVaccinationDate",
+        "weeklyPeopleVaccinatedSecondDoseByVaccinationDate",
+    ],
+    "vaccinations.reported": [
+        "newPeopleVaccinatedFirstDoseByPublishDate",
+        "newPeopleVaccinatedSecondDoseByPublishDate",
+    ],
+    "inVentilationBeds": ["covidOccupiedMVBeds"],
+}
+
+
+def getData(
+    dataDir,
+    force=False,
+    jobs=8,
+    rate=10,
+    cacheSize=64,
+    full=False,
+    window=14,
+    maxMetrics=5,
+    apiRoot="https://api.coronavirus.data.gov.uk",
+    archive=None,
+):
+    """jobs is the number of concurrent downloads and rate the maximum number of
+    requests per second, rate=0 disables rate limiting. Responses are cached in
+    dataDir/.cache/, capped at cacheSize MB, and only re-downloaded if they changed.
+    Unless full is set only the last window days of each file are updated. Up to
+    maxMetrics metrics are requested together. Progress is recorded in
+    dataDir/.manifest.json so that an interrupted run resumes where it stopped.
+    apiRoot can point at mockServer.py to fetch without touching the live API. If
+    archive is "gzip" or "zstd" the raw responses are appended, compressed, to
+    dataDir/.archive/<date>.csv.gz. Each release is recorded in dataDir/vintages.db"""
+    session = getSession(jobs)
 
-
-def getData(dataDir, force=False):
     # check for if there is new data
     if os.path.isfile(dataDir + "Last-Modified.txt"):
         with open(dataDir + "Last-Modified.txt") as file:
@@ -17,66 +77,90 @@ def getData(dataDir, force=False):
     else:
         prevLastModified = ""
 
-    url = "https://api.coronavirus.data.gov.uk/v1/data?filters=areaType=overview&structure=%7B%7D"
+    url = apiRoot + "/v1/data?filters=areaType=overview&structure=%7B%7D"
 
-    r = requests.get(url)
+    r = fetch(session, url)
     lastModified = r.headers["Last-Modified"]
 
     if prevLastModified != lastModified or force:
         print("Getting new data...")
 
-        urlPrefix = 'https://api.coronavirus.data.gov.uk/v1/data?filters=areaType={}&structure=%7B"date":"date",'
-        urls = [
-            '"newPillarOneTestsByPublishDate":"newPillarOneTestsByPublishDate","newPillarTwoTestsByPublishDate":"newPillarTwoTestsByPublishDate","newPillarFourTestsByPublishDate":"newPillarFourTestsByPublishDate"',
-            '"newCasesBySpecimenDate":"newCasesBySpecimenDate"',
-            '"newCasesByPublishDate":"newCasesByPublishDate"',
-            '"newDeaths28DaysByDeathDate":"newDeaths28DaysByDeathDate"',
-            '"newDeaths28DaysByPublishDate":"newDeaths28DaysByPublishDate"',
-            '"newDailyNsoDeathsByDeathDate":"newDailyNsoDeathsByDeathDate"',
-            '"newAdmissions":"newAdmissions"',
-            '"hospitalCases":"hospitalCases"',
-            '"weeklyPeopleVaccinatedFirstDoseByVaccinationDate":"weeklyPeopleVaccinatedFirstDoseByVaccinationDate","weeklyPeopleVaccinatedSecondDoseByVaccinationDate":"weeklyPeopleVaccinatedSecondDoseByVaccinationDate"',
-            '"newPeopleVaccinatedFirstDoseByPublishDate":"newPeopleVaccinatedFirstDoseByPublishDate","newPeopleVaccinatedSecondDoseByPublishDate":"newPeopleVaccinatedSecondDoseByPublishDate"',
-            '"covidOccupiedMVBeds":"covidOccupiedMVBeds"',
-        ]
-
-        urlSuffix = "%7D&format=csv"
-        names = [
-            "testing.reported",
-            "cases",
-            "cases.reported",
-            "deaths",
-            "deaths.reported",
-            "deaths.onCertificate",
-            "hospitalisations",
-            "inHospital",
-            "vaccinations.weekly",
-            "vaccinations.reported",
-            "inVentilationBeds",
-        ]
 
         nations = ["Scotland", "England", "Northern Ireland", "Wales"]
 
-        t = tqdm(
-            total=len(names) * 5,
-            bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} {elapsed_s:.1f}s",
+        plan = planRequests(metrics, nations, maxMetrics, apiRoot)
+        names = [name for request in plan for name in request["files"]]
+        files = len(names)
+        print(
+            "Requesting %d files in %d requests (%d saved)"
+            % (files, len(plan), files - len(plan))
+        )
+
+        manifest = Manifest(dataDir + ".manifest.json")
+        resume = manifest.get("lastModified") == lastModified and not (
+            force and manifest.get("complete")
         )
+        if not resume:
+            manifest.reset(lastModified=lastModified, complete=False)
 
-        for i, name in enumerate(names):
-            suffix = urls[i] + urlSuffix
-            for nation in nations:
-                prefix = urlPrefix.format("nation;areaName={}").format(nation)
-                fileName = nation + "." + name
-                updateProgressBar(fileName, t)
-                getCSV(prefix + suffix, dataDir, fileName)
+        t = tqdm(
+            total=files, bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} {elapsed_s:.1f}s",
+        )
 
-            prefix = urlPrefix.format("overview")
-            fileName = "UK." + name
-            updateProgressBar(fileName, t)
-            getCSV(prefix + suffix, dataDir, fileName)
+        if resume:
+            remaining = []
+            for request in plan:
+                if all(
+                    manifest.isDone(name, dataDir + name + ".csv")
+                    for name in request["files"]
+                ):
+                    updateProgressBar(request["label"], t, len(request["files"]))
+                else:
+                    remaining.append(request)
+            print("Resuming, %d of %d requests left" % (len(remaining), len(plan)))
+            plan = remaining
+
+        bucket = TokenBucket(rate) if rate > 0 else None
+        cache = HTTPCache(dataDir + ".cache/", cacheSize * 1024 * 1024)
+        responseArchive = (
+            ResponseArchive(dataDir + ".archive/", archive) if archive else None
+        )
 
-        with open(dataDir + "Last-Modified.txt", "w") as file:
-            file.write(lastModified)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(
+                    getCSV,
+                    request,
+                    dataDir,
+                    session,
+                    bucket,
+                    cache,
+                    None if full else window,
+                    manifest,
+                    responseArchive,
+                ): request
+                for request in plan
+            }
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    request = futures[future]
+                    updateProgressBar(request["label"], t, len(request["files"]))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+            finally:
+                cache.save()
+
+        writeAtomic(dataDir + "Last-Modified.txt", lastModified)
+        manifest.set(complete=True)
+
+        published = parsedate_to_datetime(lastModified).date().isoformat()
+        vintages = VintageStore(dataDir + "vintages.db")
+        changed = vintages.recordFiles(published, dataDir, names)
+        vintages.close()
+        print("Recorded %d revised rows for the release of %s" % (changed, published))
 
         # getExcessDeaths(dataDir)
 
@@ -86,43 +170,326 @@ def getData(dataDir, force=False):
         return False
 
 
-def getCSV(url, dataDir, name):
-    r = requests.get(url)
-    text = r.text
-    fileName = dataDir + name + ".csv"
-    if r.status_code == 200:
-        titles, data = text.split("\n", 1)
-
-        data = data.split("\n")
-        data = data[:-1]  # remove last blank line
-        data = list(reversed(data))
-
-        titles = titles.split(",")
-        if "newPillarOneTestsByPublishDate" in titles:
-            newData = []
-            for line in data:
-                arr = line.split(",")
-                newData.append(
-                    str(arr[0])
-                    + ","
-                    + str(parseInt(arr[1]) + parseInt(arr[2]) + parseInt(arr[3]))
-                )
-            data = newData
-
-        data = [tuple for tuple in data if not re.match(r"[\d-]+,$", tuple) and tuple[-2:] != ",,"]
-        data = "\n".join(data)
-
-        with open(fileName, "w") as file:
-            file.writelines(data)
+def planRequests(
+    metrics, nations, maxMetrics=5, apiRoot="https://api.coronavirus.data.gov.uk"
+):
+    """Packs the metrics of each file into requests of at most maxMetrics metrics, a
+    file's metrics are never split. Each batch is requested once for the UK overview and
+    once for all nations, which are split into per nation files by getCSV. Testing files
+    are requested on their own, as days on which no pillar reported are stored as 0 and
+    can't be told apart from the days of other metrics in a shared response"""
+    batches = [{}]
+    count = 0
+    for name, names in metrics.items():
+        summed = "newPillarOneTestsByPublishDate" in names
+        if batches[-1] and (summed or count + len(names) > maxMetrics):
+            batches.append({})
+            count = 0
+        batches[-1][name] = names
+        count += len(names)
+        if summed:
+            batches.append({})
+            count = 0
+
+    if not batches[-1]:
+        batches.pop()
+
+    urlPrefix = (
+        apiRoot
+        + '/v1/data?filters=areaType={}&structure=%7B"date":"date","areaName":"areaName",'
+    )
+    urlSuffix = "%7D&format=csv"
+
+    plan = []
+    for areaType, area, areas in [("overview", "UK", ["UK"]), ("nation", None, nations)]:
+        for batch in batches:
+            structure = ",".join(
+                '"%s":"%s"' % (metric, metric)
+                for names in batch.values()
+                for metric in names
+            )
+            plan.append(
+                {
+                    "url": urlPrefix.format(areaType) + structure + urlSuffix,
+                    "label": (area or "Nation") + "." + "+".join(batch),
+                    "area": area,
+                    "names": batch,
+                    "files": [
+                        area + "." + name for area in areas for name in batch
+                    ],
+                }
+            )
+
+    return plan
+
+
+def getCSV(
+    request,
+    dataDir,
+    session=requests,
+    bucket=None,
+    cache=None,
+    window=None,
+    manifest=None,
+    archive=None,
+):
+    """Streams the CSV of a planned request into dataDir/<area>.<name>.csv files in
+    chronological order, splitting the rows by area unless the request is for a single
+    area. If window is set and a file has already been downloaded, only rows within
+    window days of its last stored date are replaced. Each file is recorded in the
+    manifest once it has been replaced and new responses are added to the archive"""
+    url = request["url"]
+    headers = cache.validators(url) if cache else {}
+    r = fetch(session, url, bucket, headers=headers, stream=True)
+
+    lines = None
+    if r.status_code == 304:
+        lines = cache.lines(url)
+        if lines is None:
+            # evicted since the request was made
+            r.close()
+            r = fetch(session, url, bucket, stream=True)
+
+    if lines is None:
+        r.encoding = r.encoding or "utf-8"
+        lines = r.iter_lines(chunk_size=65536, decode_unicode=True)
+        if r.status_code == 200 and cache:
+            lines = cache.tee(url, r.headers, lines)
+        if r.status_code == 200 and archive:
+            lines = archive.tee(url, r.headers, lines)
+
+    if r.status_code in [200, 304]:
+        titles = next(lines).split(",")
+        areaColumn = titles.index("areaName")
+        columns = {
+            name: (
+                [titles.index(metric) for metric in names],
+                "newPillarOneTestsByPublishDate" in names,
+            )
+            for name, names in request["names"].items()
+        }
+
+        writers = {}
+        for line in lines:
+            if not line:
+                continue
+
+            arr = line.split(",")
+            area = request["area"] or arr[areaColumn]
+
+            for name, (indices, summed) in columns.items():
+                if (area, name) not in writers:
+                    fileName = dataDir + area + "." + name + ".csv"
+                    writers[area, name] = ChronologicalWriter(fileName, window)
+
+                row = formatRow(arr[0], [arr[i] for i in indices], summed)
+                if row:
+                    writers[area, name].add(row)
+
+        for (area, name), writer in writers.items():
+            if writer.close():
+                if manifest:
+                    manifest.setFile(area + "." + name, "done", writer.fileName)
+            else:
+                print("Error: No data returned for " + area + "." + name)
+                if manifest:
+                    manifest.setFile(area + "." + name, "empty")
+
+        r.close()
 
     elif r.status_code == 204:
-        print("Error: No data returned for " + name)
+        print("Error: No data returned for " + request["label"])
+        if manifest:
+            for name in request["files"]:
+                manifest.setFile(name, "empty")
     else:
         print("Error " + str(r.status_code))
         print(r.content)
+        if manifest:
+            for name in request["files"]:
+                if not manifest.isDone(name, dataDir + name + ".csv"):
+                    manifest.setFile(name, "failed")
         exit()
 
 
+emptyRow = re.compile(r"(?:[\d-]+,|.*,,)$")
+
+
+def formatRow(date, values, summed=False):
+    """Returns the row written for a file with the given values, None if it is empty.
+    Testing data is split over pillar columns which are summed, days without any are 0"""
+    if summed:
+        row = date + "," + str(sum(parseInt(x) for x in values))
+    else:
+        row = date + "," + ",".join(values)
+
+    if not emptyRow.match(row):
+        return row
+
+
+class ChronologicalWriter:
+    """Writes rows, which arrive newest first, to fileName oldest first, holding at most
+    bufferSize rows in memory. Full buffers are spilled reversed to a temporary file and
+    copied back in reverse order. If window is set and the file already exists, only
+    rows within window days of its last stored date are replaced"""
+
+    def __init__(self, fileName, window=None, bufferSize=4096):
+        self.fileName = fileName
+        self.bufferSize = bufferSize
+        self.buffer = []
+        self.chunks = []
+        self.rows = 0
+        # opened on the first full buffer, as most files fit in one
+        self.spill = None
+
+        self.cutoff = None
+        if window:
+            lastDate = lastStoredDate(fileName)
+            if lastDate:
+                self.cutoff = (lastDate - timedelta(window)).isoformat()
+
+    def add(self, row):
+        if self.cutoff and row[:10] <= self.cutoff:
+            return
+
+        self.rows += 1
+        self.buffer.append(row)
+        if len(self.buffer) == self.bufferSize:
+            if self.spill is None:
+                self.spill = tempfile.TemporaryFile("w+")
+            self.chunks.append(self.spill.tell())
+            self.spill.write("\n".join(reversed(self.buffer)) + "\n")
+            self.buffer = []
+
+    def close(self):
+        """Writes the file, returns False without touching it if no rows were added"""
+        try:
+            return self.writeFile()
+        finally:
+            if self.spill:
+                self.spill.close()
+
+    def writeFile(self):
+        if not self.rows and not self.cutoff:
+            return False
+
+        tempName = self.fileName + ".tmp"
+        separator = ""
+
+        with open(tempName, "w") as out:
+
+            def write(row):
+                nonlocal separator
+                out.write(separator + row)
+                separator = "\n"
+
+            if self.cutoff:
+                with open(self.fileName) as stored:
+                    for row in stored:
+                        row = row.rstrip("\n")
+                        if row and row[:10] <= self.cutoff:
+                            write(row)
+
+            for row in reversed(self.buffer):
+                write(row)
+
+            for chunk in reversed(self.chunks):
+                self.spill.seek(chunk)
+                for _ in range(self.bufferSize):
+                    write(self.spill.readline().rstrip("\n"))
+
+        os.replace(tempName, self.fileName)
+        return True
+
+
+def lastStoredDate(fileName):
+    """Returns the date of the last row of a previously downloaded file, None if there
+    isn't one"""
+    if not os.path.isfile(fileName) or os.path.getsize(fileName) == 0:
+        return None
+
+    with open(fileName, "rb") as file:
+        file.seek(max(0, os.path.getsize(fileName) - 256))
+        lastRow = file.read().decode("utf-8").strip().split("\n")[-1]
+
+    return date.fromisoformat(lastRow[:10])
+
+
+def getSession(jobs=8):
+    """Creates a session whose connection pool is large enough for jobs threads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=jobs)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # iter_lines decompresses the stream as it is read
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+def fetch(session, url, bucket=None, retries=5, backoff=1, **kwargs):
+    """GET url, retrying with exponential backoff on 429/5xx responses and connection
+    errors. The last response is returned if all retries fail"""
+    for attempt in range(retries + 1):
+        if bucket:
+            bucket.take()
+
+        try:
+            r = session.get(url, timeout=60, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            time.sleep(retryDelay(None, attempt, backoff))
+            continue
+
+        if (r.status_code != 429 and r.status_code < 500) or attempt == retries:
+            return r
+
+        time.sleep(retryDelay(r, attempt, backoff))
+
+
+def retryDelay(r, attempt, backoff=1):
+    """Uses the Retry-After header if the server sent one, otherwise exponential
+    backoff with jitter"""
+    if r is not None and r.headers.get("Retry-After", "").isdigit():
+        return int(r.headers["Retry-After"])
+    delay = backoff * 2 ** attempt
+    return delay + random.uniform(0, delay)
+
+
+class TokenBucket:
+    """Thread safe token bucket allowing rate requests per second, with bursts of up to
+    capacity requests"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = max(1, capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Blocks until a request is allowed"""
+        while True:
+            wait = self.tryTake()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def tryTake(self):
+        """Takes a token if one is available and returns 0, otherwise returns the number
+        of seconds until one will be"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+
 def getExcessDeaths(dataDir):
     data = pd.read_csv(
         "https://raw.githubusercontent.com/TheEconomist/covid-19-excess-deaths-tracker/master/output-data/excess-deaths/britain_excess_deaths.csv",
@@ -155,8 +522,8 @@ def parseInt(str):
     return int(str) if str else 0
 
 
-def updateProgressBar(figname, t):
-    t.update()
+def updateProgressBar(figname, t, n=1):
+    t.update(n)
     t.set_description(figname)
 
 
@@ -183,6 +550,66 @@ def defineArgParser():
         type=str,
     )
 
+    parser.add_argument(
+        "--full",
+        help="Replace the whole history of each file rather than the last few days",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--window",
+        help="Number of days before the last stored date that are updated [default: 14]",
+        default=14,
+        type=int,
+    )
+
+    parser.add_argument(
+        "-m",
+        "--maxMetrics",
+        help="Maximum number of metrics requested together [default: 5]",
+        default=5,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--api",
+        help="Root URL of the API [default: https://api.coronavirus.data.gov.uk]",
+        default="https://api.coronavirus.data.gov.uk",
+        type=str,
+    )
+
+    parser.add_argument(
+        "-a",
+        "--archive",
+        help="Append raw responses to a compressed file per day in dataDir/.archive/",
+        choices=["gzip", "zstd"],
+        default=None,
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of concurrent downloads [default: 8]",
+        default=8,
+        type=int,
+    )
+
+    parser.add_argument(
+        "-r",
+        "--rate",
+        help="Maximum requests per second, 0 for no limit [default: 10]",
+        default=10,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--cacheSize",
+        help="Maximum size of the response cache in MB [default: 64]",
+        default=64,
+        type=float,
+    )
+
     return parser
 
 
@@ -195,7 +622,18 @@ if __name__ == "__main__":
     if not os.path.exists(dataDir):
         os.mkdir(dataDir)
 
-    newData = getData(dataDir, clArgs.force)
+    newData = getData(
+        dataDir,
+        clArgs.force,
+        clArgs.jobs,
+        clArgs.rate,
+        clArgs.cacheSize,
+        clArgs.full,
+        clArgs.window,
+        clArgs.maxMetrics,
+        clArgs.api,
+        clArgs.archive,
+    )
 
     if not newData:
         print("No new data.")
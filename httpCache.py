@@ -0,0 +1,159 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class HTTPCache:
+    """On-disk cache of response bodies and their ETag/Last-Modified validators. The
+    total size of the bodies is capped at maxSize bytes, evicting the least recently
+    used entries first"""
+
+    def __init__(self, cacheDir, maxSize=64 * 1024 * 1024):
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize
+        self.indexFile = os.path.join(cacheDir, "index.json")
+        self.lock = threading.Lock()
+
+        os.makedirs(cacheDir, exist_ok=True)
+
+        self.index = {}
+        if os.path.isfile(self.indexFile):
+            with open(self.indexFile) as file:
+                self.index = json.load(file)
+
+        # drop bodies left behind by a run that didn't save its index
+        known = {entry["file"] for entry in self.index.values()}
+        for fileName in os.listdir(cacheDir):
+            if fileName != "index.json" and fileName not in known:
+                os.remove(os.path.join(cacheDir, fileName))
+
+    def validators(self, url):
+        """Returns the conditional request headers for url, empty if it isn't cached"""
+        with self.lock:
+            entry = self.index.get(url)
+
+        if not entry or not os.path.isfile(self.bodyPath(entry)):
+            return {}
+
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["lastModified"]:
+            headers["If-Modified-Since"] = entry["lastModified"]
+        return headers
+
+    def lines(self, url):
+        """Returns an iterator over the lines of the cached body of url, or None if it
+        has been evicted"""
+        with self.lock:
+            entry = self.index.get(url)
+            if not entry:
+                return None
+            entry["lastUsed"] = time.time()
+
+        try:
+            file = open(self.bodyPath(entry), encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+        return readLines(file)
+
+    def tee(self, url, headers, lines):
+        """Yields lines while storing them, along with the validators from the response
+        headers, as the cached body of url. The body is only stored once every line has
+        been consumed and responses without validators aren't cached"""
+        etag = headers.get("ETag", "")
+        lastModified = headers.get("Last-Modified", "")
+        if not etag and not lastModified:
+            yield from lines
+            return
+
+        entry = {
+            "file": hashlib.sha1(url.encode("utf-8")).hexdigest(),
+            "etag": etag,
+            "lastModified": lastModified,
+            "size": 0,
+            "lastUsed": time.time(),
+        }
+
+        # write to a temporary file so concurrent readers never see a partial body
+        tempPath = self.bodyPath(entry) + "." + str(threading.get_ident())
+        try:
+            with open(tempPath, "w", encoding="utf-8") as file:
+                for line in lines:
+                    file.write(line + "\n")
+                    yield line
+
+            entry["size"] = os.path.getsize(tempPath)
+
+            with self.lock:
+                os.replace(tempPath, self.bodyPath(entry))
+                self.index[url] = entry
+                self.evict()
+        finally:
+            if os.path.isfile(tempPath):
+                os.remove(tempPath)
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in maxSize, must be
+        called with the lock held"""
+        size = sum(entry["size"] for entry in self.index.values())
+        if size <= self.maxSize:
+            return
+
+        for url, entry in sorted(self.index.items(), key=lambda x: x[1]["lastUsed"]):
+            if size <= self.maxSize:
+                break
+            del self.index[url]
+            size -= entry["size"]
+            try:
+                os.remove(self.bodyPath(entry))
+            except FileNotFoundError:
+                pass
+
+    def save(self):
+        with self.lock:
+            tempPath = self.indexFile + ".tmp"
+            with open(tempPath, "w") as file:
+                json.dump(self.index, file)
+            os.replace(tempPath, self.indexFile)
+
+    def bodyPath(self, entry):
+        return os.path.join(self.cacheDir, entry["file"])
+
+
+def readLines(file):
+    with file:
+        for line in file:
+            yield line.rstrip("\n")
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "-C",
+        "--cacheDir",
+        help="Directory where cached responses are stored [default: data/.cache/]",
+        default="data/.cache/",
+        type=str,
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    cache = HTTPCache(clArgs.cacheDir)
+    size = sum(entry["size"] for entry in cache.index.values())
+    print("%d responses, %.1f MB" % (len(cache.index), size / 1024 / 1024))
+    for url, entry in sorted(cache.index.items(), key=lambda x: -x[1]["lastUsed"]):
+        print(entry["lastModified"] or entry["etag"], url)
@@ -0,0 +1,103 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+
+
+class Manifest:
+    """JSON record of the status and content hash of each file written by a run. It is
+    saved atomically after every change so it stays consistent if the run is killed"""
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.lock = threading.Lock()
+
+        self.data = {"files": {}}
+        if os.path.isfile(fileName):
+            with open(fileName) as file:
+                self.data = json.load(file)
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.data.get(key, default)
+
+    def set(self, **values):
+        with self.lock:
+            self.data.update(values)
+            self.save()
+
+    def reset(self, **values):
+        """Forgets every file, starting a new run"""
+        with self.lock:
+            self.data = {"files": {}, **values}
+            self.save()
+
+    def setFile(self, name, status, path=None):
+        """Records the status of a file, with its hash if path is given"""
+        with self.lock:
+            self.data["files"][name] = {
+                "status": status,
+                "sha256": hashFile(path) if path else "",
+            }
+            self.save()
+
+    def isDone(self, name, path):
+        """True if the file was completed by this run and hasn't changed since"""
+        with self.lock:
+            entry = self.data["files"].get(name)
+
+        if not entry or entry["status"] not in ["done", "empty"]:
+            return False
+        if entry["status"] == "empty":
+            return True
+        return os.path.isfile(path) and hashFile(path) == entry["sha256"]
+
+    def save(self):
+        """Must be called with the lock held"""
+        writeAtomic(self.fileName, json.dumps(self.data, indent=1))
+
+
+def hashFile(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(65536), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def writeAtomic(fileName, contents):
+    """Writes to a temporary file and renames it over fileName, so readers see either
+    the old or the new contents and never a partial file"""
+    tempName = fileName + ".tmp"
+    with open(tempName, "w") as file:
+        file.write(contents)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tempName, fileName)
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "fileName", help="Manifest to summarise [default: data/.manifest.json]",
+        default="data/.manifest.json", nargs="?", type=str,
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    manifest = Manifest(clArgs.fileName)
+    for key, value in manifest.data.items():
+        if key != "files":
+            print(key + ":", value)
+    for name, entry in sorted(manifest.data["files"].items()):
+        print(entry["status"].ljust(6), entry["sha256"][:12].ljust(12), name)
@@ -0,0 +1,340 @@
+"""Local stand-in for api.coronavirus.data.gov.uk, serving recorded responses so the
+fetch stage can be run and benchmarked offline. Unknown requests are recorded from
+the live API with --record, or built from the CSVs in --dataDir"""
+import argparse
+import gzip
+import hashlib
+import http.server
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from email.utils import formatdate
+
+import requests
+
+from getData import metrics, TokenBucket
+from manifest import writeAtomic
+
+
+class MockAPIServer(http.server.ThreadingHTTPServer):
+    """latency is added to every response in seconds and bandwidth limits each response
+    to that many bytes per second, 0 for no limit. tooManyRequests is the fraction of
+    requests answered with a 429, rate the number of requests per second served before
+    answering with a 429. If compress is set responses are gzipped for clients that
+    accept it"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        fixturesDir="fixtures/",
+        latency=0,
+        bandwidth=0,
+        tooManyRequests=0,
+        rate=0,
+        record=False,
+        upstream="https://api.coronavirus.data.gov.uk",
+        dataDir=None,
+        compress=False,
+    ):
+        super().__init__(address, MockAPIHandler)
+        self.fixturesDir = fixturesDir
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.tooManyRequests = tooManyRequests
+        self.bucket = TokenBucket(rate) if rate > 0 else None
+        self.record = record
+        self.upstream = upstream
+        self.dataDir = dataDir
+        self.compress = compress
+
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "bytes": 0, "status": {}}
+
+        os.makedirs(fixturesDir, exist_ok=True)
+        self.indexFile = os.path.join(fixturesDir, "index.json")
+        self.index = {}
+        if os.path.isfile(self.indexFile):
+            with open(self.indexFile) as file:
+                self.index = json.load(file)
+
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def fixture(self, path):
+        """Returns the status, headers and body recorded for path, recording or building
+        it if it isn't known. None if it can't be found"""
+        with self.lock:
+            entry = self.index.get(path)
+
+        if entry:
+            with open(os.path.join(self.fixturesDir, entry["file"]), "rb") as file:
+                return entry["status"], entry["headers"], file.read()
+
+        if self.record:
+            r = requests.get(self.upstream + path, timeout=60)
+            headers = {
+                key: r.headers[key] for key in ["Last-Modified", "ETag"] if key in r.headers
+            }
+            self.save(path, r.status_code, headers, r.content)
+            return r.status_code, headers, r.content
+
+        if self.dataDir:
+            return synthesise(path, self.dataDir)
+
+        return None
+
+    def save(self, path, status, headers, body):
+        entry = {
+            "file": hashlib.sha1(path.encode("utf-8")).hexdigest() + ".csv",
+            "status": status,
+            "headers": headers,
+        }
+        with open(os.path.join(self.fixturesDir, entry["file"]), "wb") as file:
+            file.write(body)
+
+        with self.lock:
+            self.index[path] = entry
+            writeAtomic(self.indexFile, json.dumps(self.index, indent=1))
+
+    def count(self, status, size):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += size
+            self.stats["status"][status] = self.stats["status"].get(status, 0) + 1
+
+    def resetStats(self):
+        with self.lock:
+            self.stats = {"requests": 0, "bytes": 0, "status": {}}
+
+
+class MockAPIHandler(http.server.BaseHTTPRequestHandler):
+    # keep connections open so that connection pooling can be measured
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        path = urllib.parse.unquote(self.path)
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        limited = server.bucket and server.bucket.tryTake()
+        if limited or random.random() < server.tooManyRequests:
+            return self.respond(429, {"Retry-After": "1"})
+
+        fixture = server.fixture(path)
+        if fixture is None:
+            return self.respond(404, {}, b"No fixture for " + path.encode("utf-8"))
+
+        status, headers, body = fixture
+
+        if status == 200 and notModified(self.headers, headers):
+            return self.respond(304, headers)
+
+        if status != 200:
+            body = b""
+        elif server.compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+            headers = {**headers, "Content-Encoding": "gzip"}
+            body = gzip.compress(body)
+
+        self.respond(status, headers, body)
+
+    def respond(self, status, headers, body=b""):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        bandwidth = self.server.bandwidth
+        chunkSize = 16384
+        for start in range(0, len(body), chunkSize):
+            chunk = body[start : start + chunkSize]
+            self.wfile.write(chunk)
+            if bandwidth:
+                time.sleep(len(chunk) / bandwidth)
+
+        self.server.count(status, len(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def notModified(requestHeaders, headers):
+    if "If-None-Match" in requestHeaders:
+        return requestHeaders["If-None-Match"] == headers.get("ETag")
+    if "If-Modified-Since" in requestHeaders:
+        return requestHeaders["If-Modified-Since"] == headers.get("Last-Modified")
+    return False
+
+
+def synthesise(path, dataDir):
+    """Builds the response the API would give for path from the CSVs in dataDir. Testing
+    files only store the sum of the pillars, which is returned as pillar one. Days with
+    no tests are returned with every pillar empty, as the API does on days no pillar
+    reported"""
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(path).query)
+    filters = dict(f.split("=", 1) for f in query["filters"][0].split(";"))
+    columns = list(json.loads(query["structure"][0]))
+
+    # the file and column holding each metric, None for the pillars that aren't stored
+    files = {}
+    summed = {}
+    for name, names in metrics.items():
+        for i, metric in enumerate(names):
+            summed[metric] = "newPillarOneTestsByPublishDate" in names
+            if summed[metric]:
+                files[metric] = (name, None if i else 1)
+            else:
+                files[metric] = (name, i + 1)
+
+    if filters["areaType"] == "overview":
+        areas = [("UK", "United Kingdom")]
+    else:
+        nations = ["England", "Northern Ireland", "Scotland", "Wales"]
+        areas = [(n, n) for n in nations if filters.get("areaName", n) == n]
+
+    rows = []
+    for area, areaName in areas:
+        data = {}
+        for metric in [c for c in columns if c in files]:
+            fileName = os.path.join(dataDir, area + "." + files[metric][0] + ".csv")
+            data[metric] = {}
+            if os.path.isfile(fileName):
+                with open(fileName) as file:
+                    for line in file.read().split("\n"):
+                        if line:
+                            data[metric][line[:10]] = line.split(",")
+
+        dates = set().union(*data.values())
+        for date in dates:
+            row = []
+            for column in columns:
+                if column == "date":
+                    row.append(date)
+                elif column == "areaName":
+                    row.append(areaName)
+                elif column in data:
+                    arr = data[column].get(date)
+                    i = files[column][1]
+                    if arr is None or (summed[column] and arr[1] == "0"):
+                        row.append("")
+                    else:
+                        row.append(arr[i] if i else "0")
+            rows.append(row)
+
+    # newest first, as the API returns them
+    rows.sort(key=lambda row: row[0], reverse=True)
+
+    lastModified = formatdate(usegmt=True)
+    if os.path.isfile(os.path.join(dataDir, "Last-Modified.txt")):
+        with open(os.path.join(dataDir, "Last-Modified.txt")) as file:
+            lastModified = file.read()
+
+    if data and not rows:
+        return 204, {"Last-Modified": lastModified}, b""
+
+    body = ",".join(columns) + "\n" + "".join(",".join(row) + "\n" for row in rows)
+    return 200, {"Last-Modified": lastModified}, body.encode("utf-8")
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "-p", "--port", help="Port to listen on [default: 8000]", default=8000, type=int,
+    )
+
+    parser.add_argument(
+        "-F",
+        "--fixturesDir",
+        help="Directory where recorded responses are stored [default: fixtures/]",
+        default="fixtures/",
+        type=str,
+    )
+
+    parser.add_argument(
+        "-r",
+        "--record",
+        help="Record requests without a fixture from the live API",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-D",
+        "--dataDir",
+        help="Build responses without a fixture from the CSVs in this directory",
+        default=None,
+        type=str,
+    )
+
+    parser.add_argument(
+        "-l",
+        "--latency",
+        help="Seconds added to every response [default: 0]",
+        default=0,
+        type=float,
+    )
+
+    parser.add_argument(
+        "-b",
+        "--bandwidth",
+        help="Bytes per second of each response, 0 for no limit [default: 0]",
+        default=0,
+        type=float,
+    )
+
+    parser.add_argument(
+        "--tooManyRequests",
+        help="Fraction of requests answered with a 429 [default: 0]",
+        default=0,
+        type=float,
+    )
+
+    parser.add_argument(
+        "-z",
+        "--gzip",
+        help="Gzip responses for clients that accept it",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--rate",
+        help="Requests per second served before answering with a 429 [default: 0]",
+        default=0,
+        type=float,
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    server = MockAPIServer(
+        ("127.0.0.1", clArgs.port),
+        clArgs.fixturesDir,
+        clArgs.latency,
+        clArgs.bandwidth,
+        clArgs.tooManyRequests,
+        clArgs.rate,
+        clArgs.record,
+        dataDir=clArgs.dataDir,
+        compress=clArgs.gzip,
+    )
+    print("Serving on " + server.url())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats, indent=1))
@@ -1,37 +1,56 @@
 import argparse
+import hashlib
+import io
+import json
 import math
 import os
-from datetime import datetime as dt, timedelta
-from operator import add
+import threading
+from datetime import datetime as dt
 
 import matplotlib
 import matplotlib.font_manager as font_manager
-import matplotlib.gridspec as gridspec
-import matplotlib.pyplot as plt
 import matplotlib.ticker as tkr
 # import mpld3
 import numpy as np
 import pandas as pd
 from matplotlib.dates import DateFormatter as df
 from matplotlib.dates import MonthLocator
+from matplotlib.figure import Figure
 from tqdm.rich import tqdm
 
 from getData import getData
-from readData import readData
+from manifest import Manifest, hashFile
+from readData import readData, readMany
 from processData import processData
-from tidySVG import tidySVG
+from columnStore import importData, openStore, readFrame
+from dayAxis import align, toFrame
+from derivedMetrics import metricCache
+from renderPool import render
+from rollingKernels import rollingMean, rollingSum
+from rollup import days, rollup, rollupFiles, rollupMetrics
+from tidySVG import tidySVGBytes
 
 
-def mainPlot(t, dataDir="data/", plotsDir="plots/", avg=True):
-    """avg indicates seven day average of new cases should be used"""
+def mainPlot(
+    t, dataDir="data/", plotsDir="plots/", avg=True, store=None, groups=None
+):
+    """avg indicates seven day average of new cases should be used. If store is given
+    the processed data is read from that columnStore directory. groups selects which
+    of the UK and nation figures to plot, by default both"""
     nationList = [["UK"], ["Scotland", "England", "Northern Ireland", "Wales"]]
     colorsList = [["#2271d3"], ["#003078", "#5694CA", "#FFDD00", "#D4351C"]]
     fignames = ["", "-Nation"]
 
     for outerI, nations in enumerate(nationList):
+        if groups is not None and outerI not in groups:
+            continue
+
         data = {}
         for nation in nations:
-            if avg:
+            if store:
+                prefix = "processed.avg." if avg else "processed."
+                data[nation] = readFrame(store, prefix, nation)
+            elif avg:
                 data[nation] = pd.read_csv(
                     dataDir + nation + ".avg.csv", index_col=0, parse_dates=True
                 )
@@ -54,24 +73,18 @@ def mainPlot(t, dataDir="data/", plotsDir="plots/", avg=True):
             suffix, outerI, avg, t, data, colorsList[outerI], nations, plotsDir,
         )
 
-        deathsPlot(suffix, outerI, avg, t, data, nations, plotsDir, dataDir)
-
-        if avg == False:
-            weeklyIncreasePlot(data, nations, suffix, outerI, t, plotsDir)
+        deathsPlot(suffix, outerI, avg, t, data, nations, plotsDir, dataDir, store)
 
         if outerI == 0:
             ComparisonUK(plotsDir, avg, t, data)
         else:
-            ComparisonNation(plotsDir, avg, t, data, nations)
+            metrics = processedMetrics(data, dataDir, avg, store)
+            ComparisonNation(plotsDir, avg, t, data, nations, metrics)
 
 
-def readFile(name, avg):
-    data = readData(name)
-    # convert to np array and separate dates from case counts
-    casesData = np.array(data)
-    casesRawDates = casesData[:, 0]
-    casesDates = [dt.strptime(x, "%Y-%m-%d") for x in casesRawDates]
-    cases = casesData[:, 1].astype(float)
+def readFile(name, avg, store=None):
+    casesDates, cases = readData(name, type="np", store=store)
+    cases = cases.astype(float)
 
     # compute seven day average of cases if enabled
     if avg:
@@ -89,7 +102,7 @@ def testingPlot(suffix, outerI, avg, t, data, nations, plotsDir):
     updateProgressBar(figname, t)
 
     if outerI == 0:
-        fig, ax = plt.subplots()
+        fig, ax = subplots()
 
         setTitle(ax, title)
 
@@ -130,7 +143,8 @@ def testingPlot(suffix, outerI, avg, t, data, nations, plotsDir):
         removeSpines(ax)
         showGrid(ax)
     else:
-        fig, axs = plt.subplots(2, 2, sharex=True)
+        layout = template(2, 2, sharex=True)
+        fig, axs = layout.begin()
         axs = axs.flatten()
 
         setSupTitle(fig, title)
@@ -138,7 +152,7 @@ def testingPlot(suffix, outerI, avg, t, data, nations, plotsDir):
         for j, nation in enumerate(data):
             ax = axs[j]
 
-            ax.plot(data[nation].index, data[nation]["posTests"], color="#333")
+            layout.line(ax, data[nation].index, data[nation]["posTests"], color="#333")
 
             maxArray = [x >= 5 for x in data[nation]["posTests"]]
             minArray = [x <= 5 for x in data[nation]["posTests"]]
@@ -159,22 +173,20 @@ def testingPlot(suffix, outerI, avg, t, data, nations, plotsDir):
                 interpolate=True,
             )
 
-            dateAxis(ax)
+            dateLimits(ax)
             reduceXlabels(ax)
             reduceYlabels(ax)
 
             setYLabel(ax, "% positive tests per day", avg)
-            showGrid(ax)
             percentAxis(ax)
 
             ax.set_title(nations[j])
-            removeSpines(ax)
 
     savePlot(plotsDir, figname, fig)
 
 
 def percentPositivePlot(t, plotsDir, avg, colors, suffix, outerI, nations, data):
-    fig, ax = plt.subplots()
+    fig, ax = subplots()
     figname = "PercentPositive" + suffix
     if outerI == 0:
         title = "UK COVID-19 cases compared to percentage of tests which are positive"
@@ -233,7 +245,7 @@ def percentPositivePlot(t, plotsDir, avg, colors, suffix, outerI, nations, data)
         color="#666",
     )
     dateAxis(ax)
-    plt.legend()
+    (ax2 if outerI == 0 else ax).legend()
     removeSpines(ax)
     savePlot(plotsDir, figname, fig)
 
@@ -246,7 +258,7 @@ def doubleBarChartPlot(t, plotsDir, avg, suffix, outerI, nations, data):
         title += " (averaged)"
     updateProgressBar(figname, t)
     if outerI == 0:
-        fig, ax = plt.subplots()
+        fig, ax = subplots()
         ax.set_title(title, fontweight="bold")
         fivePercent = [x * 0.05 for x in data["UK"]["reportedTests"]]
         ax.bar(
@@ -281,7 +293,7 @@ def doubleBarChartPlot(t, plotsDir, avg, suffix, outerI, nations, data):
         showGrid(ax)
         ax.legend()
     else:
-        fig, axs = plt.subplots(2, 2, sharex=True)
+        fig, axs = subplots(2, 2, sharex=True)
         axs = axs.flatten()
         fig.suptitle(title, fontweight="bold")
         for j, nation in enumerate(data):
@@ -333,7 +345,7 @@ def mortalityHospitalisationPlot(
         if avg:
             figname += "-Avg"
         updateProgressBar(figname, t)
-        fig, ax = plt.subplots()
+        fig, ax = subplots()
 
         if outerI == 0:
             title = "%s of COVID-19 in the UK" % innerTitles[innerI]
@@ -377,7 +389,7 @@ def mortalityHospitalisationPlot(
             setYLabel(ax, "Percent %s per day" % innerYlables[innerI], avg)
             percentAxis(ax)
 
-            plt.legend()
+            ax.legend()
 
         if avg:
             title += " (averaged)"
@@ -398,7 +410,7 @@ def mortalityHospitalisationPlot(
         savePlot(plotsDir, figname, fig)
 
 
-def deathsPlot(suffix, outerI, avg, t, data, nations, plotsDir, dataDir):
+def deathsPlot(suffix, outerI, avg, t, data, nations, plotsDir, dataDir, store=None):
     figname = "Deaths" + suffix
     title = "Comparing four different death metrics in the UK for COVID-19"
     if avg:
@@ -407,11 +419,13 @@ def deathsPlot(suffix, outerI, avg, t, data, nations, plotsDir, dataDir):
     updateProgressBar(figname, t)
 
     if outerI == 0:
-        fig, ax = plt.subplots()
+        fig, ax = subplots()
 
         setTitle(ax, title)
 
-        excessDeaths = readData(dataDir + "UK.deaths.excess.csv", type="dict")
+        excessDeaths = readData(
+            dataDir + "UK.deaths.excess.csv", type="dict", store=store
+        )
         excessSeries = pd.Series(excessDeaths)
 
         ax.fill_between(
@@ -452,12 +466,12 @@ def deathsPlot(suffix, outerI, avg, t, data, nations, plotsDir, dataDir):
 
         setYLabel(ax, "Deaths per day", avg)
         threeFigureAxis(ax, bottom=None)
-        plt.legend()
+        ax.legend()
 
         removeSpines(ax)
         showGrid(ax)
     else:
-        fig, axs = plt.subplots(2, 2, sharex=True)
+        fig, axs = subplots(2, 2, sharex=True)
         axs = axs.flatten()
 
         setSupTitle(fig, title)
@@ -465,7 +479,9 @@ def deathsPlot(suffix, outerI, avg, t, data, nations, plotsDir, dataDir):
         for j, nation in enumerate(data):
             ax = axs[j]
 
-            excessDeaths = readData(dataDir + nation + ".deaths.excess.csv", type="dict")
+            excessDeaths = readData(
+                dataDir + nation + ".deaths.excess.csv", type="dict", store=store
+            )
             excessSeries = pd.Series(excessDeaths)
 
             ax.fill_between(
@@ -506,7 +522,7 @@ def deathsPlot(suffix, outerI, avg, t, data, nations, plotsDir, dataDir):
             reduceXlabels(ax)
             reduceYlabels(ax)
             if j == 0:
-                plt.legend()
+                ax.legend()
 
             setYLabel(ax, "deaths per day", avg)
             showGrid(ax)
@@ -518,72 +534,73 @@ def deathsPlot(suffix, outerI, avg, t, data, nations, plotsDir, dataDir):
     savePlot(plotsDir, figname, fig)
 
 
-def weeklyIncreasePlot(data, nations, suffix, outerI, t, plotsDir="plots/"):
+# The rollups weeklyIncreasePlot reads, of the UK only
+weeklyIncreaseRollups = ["weekly", "dayOfWeek"]
 
-    if outerI == 0:
-        df = data[nations[0]]
-        grouped = df.resample("W").sum()
-        types = [
-            {
-                "title": "reported cases",
-                "figname": "-Cases-Reported",
-                "col": "reportedCases",
-            },
-            {"title": "cases", "figname": "-Cases-Specimen", "col": "specimenCases",},
-            {
-                "title": "reported deaths",
-                "figname": "-Deaths-Reported",
-                "col": "reportedDeaths",
-            },
-            {
-                "title": "deaths",
-                "figname": "-Deaths-Specimen",
-                "col": "specimenDeaths",
-            },
-            {
-                "title": "patients in hospital",
-                "figname": "-inHospital",
-                "col": "inHospital",
-            },
-        ]
 
-        for figtype in types:
-            figname = "Increase" + suffix + figtype["figname"]
-            title = "weekly increase of COVID-19 %s in the UK" % figtype["title"]
-            updateProgressBar(figname, t)
-            lastSunday = df[figtype["col"]].last_valid_index() - timedelta(
-                df[figtype["col"]].last_valid_index().isoweekday()
-            )
-            plotData = grouped[grouped[figtype["col"]].gt(1000).idxmax() : lastSunday][
-                figtype["col"]
-            ].pct_change()
+def weeklyIncreasePlot(t, dataDir="data/", plotsDir="plots/"):
+    rollups = rollupMetrics(dataDir)
+    types = [
+        {
+            "title": "reported cases",
+            "figname": "-Cases-Reported",
+            "col": "reportedCases",
+        },
+        {"title": "cases", "figname": "-Cases-Specimen", "col": "specimenCases",},
+        {
+            "title": "reported deaths",
+            "figname": "-Deaths-Reported",
+            "col": "reportedDeaths",
+        },
+        {
+            "title": "deaths",
+            "figname": "-Deaths-Specimen",
+            "col": "specimenDeaths",
+        },
+        {
+            "title": "patients in hospital",
+            "figname": "-inHospital",
+            "col": "inHospital",
+        },
+    ]
 
-            positive = plotData <= 0
+    for figtype in types:
+        figname = "Increase" + figtype["figname"]
+        title = "weekly increase of COVID-19 %s in the UK" % figtype["title"]
+        updateProgressBar(figname, t)
+        key = ("UK", figtype["col"])
+        lastSunday = rollups.get("UK.dayOfWeek").loc[key, "lastSunday"]
+        weeks = rollups.get("UK.weekly").loc[key].set_index("week")
 
-            fig, ax = plt.subplots()
+        # from the first week over 1000, without the change into that week
+        start = weeks["sum"].gt(1000).idxmax()
+        plotData = weeks["change"][start:lastSunday]
+        plotData = plotData.where(plotData.index > start)
 
-            setTitle(ax, title)
+        positive = plotData <= 0
 
-            ax.bar(
-                plotData.index,
-                plotData,
-                color=positive.map({True: "#9ECCB8", False: "#FFA09B"}),
-                width=5.6,
-            )
+        fig, ax = subplots()
 
-            lockdownVlines(ax)
+        setTitle(ax, title)
 
-            dateAxis(ax)
+        ax.bar(
+            plotData.index,
+            plotData,
+            color=positive.map({True: "#9ECCB8", False: "#FFA09B"}),
+            width=5.6,
+        )
 
-            setYLabel(ax, "Weekly increase in COVID-19 %s" % figtype["title"], 0)
-            percentAxis(ax, setBottom=0)
+        lockdownVlines(ax)
 
-            removeSpines(ax)
-            showGrid(ax)
+        dateAxis(ax)
 
-            savePlot(plotsDir, figname, fig)
-    else:
-        pass
+        setYLabel(ax, "Weekly increase in COVID-19 %s" % figtype["title"], 0)
+        percentAxis(ax, setBottom=0)
+
+        removeSpines(ax)
+        showGrid(ax)
+
+        savePlot(plotsDir, figname, fig)
 
 
 def ComparisonUK(plotsDir, avg, t, data):
@@ -592,7 +609,7 @@ def ComparisonUK(plotsDir, avg, t, data):
     if avg:
         figname += "-Avg"
     updateProgressBar(figname, t)
-    fig, ax = plt.subplots()
+    fig, ax = subplots()
 
     fig.subplots_adjust(right=0.75)
 
@@ -650,8 +667,22 @@ def ComparisonUK(plotsDir, avg, t, data):
     savePlot(plotsDir, figname, fig)
 
 
-def ComparisonNation(plotsDir, avg, t, data, nations):
-    populations = [5466000, 56550138, 1895510, 3169586]
+def processedMetrics(data, dataDir="data/", avg=True, store=None):
+    """The MetricCache of the columns of the processed data of the areas of data, as
+    frames with a column per area"""
+
+    def load(column):
+        series = [
+            (data[area].index.values.astype("datetime64[D]"), data[area][column])
+            for area in data
+        ]
+        return toFrame(*align(series), list(data))
+
+    return metricCache(("processed", dataDir, avg, store, tuple(data)), load)
+
+
+def ComparisonNation(plotsDir, avg, t, data, nations, metrics):
+    columns = ["reportedCases", "inHospital", "specimenDeaths"]
 
     fignameSuffix = ["", "-Per-Capita"]
     titleSuffix = ["", ", per capita"]
@@ -667,7 +698,7 @@ def ComparisonNation(plotsDir, avg, t, data, nations):
             figname += "-Avg"
         updateProgressBar(figname, t)
 
-        fig, axs = plt.subplots(2, 2, sharex=True)
+        fig, axs = subplots(2, 2, sharex=True)
         fig.subplots_adjust(right=0.75, wspace=0.4)
 
         if avg:
@@ -691,14 +722,11 @@ def ComparisonNation(plotsDir, avg, t, data, nations):
             # Second, show the right spine.
             ax3.spines["right"].set_visible(True)
 
-            cases = data[nation]["reportedCases"]
-            inHospital = data[nation]["inHospital"]
-            deaths = data[nation]["specimenDeaths"]
-
-            if perCapita[i]:
-                cases = [x / populations[j] * 100 for x in cases]
-                inHospital = [x / populations[j] * 100 for x in inHospital]
-                deaths = [x / populations[j] * 100 for x in deaths]
+            steps = ["perCapita"] if perCapita[i] else []
+            cases, inHospital, deaths = [
+                metrics.get(column, *steps)[nation].reindex(data[nation].index)
+                for column in columns
+            ]
 
             (p1,) = ax.plot(data[nation].index, cases, "orangered", ls="-")
             (p2,) = ax2.plot(data[nation].index, inHospital, "#851bc2", ls="-",)
@@ -720,7 +748,7 @@ def ComparisonNation(plotsDir, avg, t, data, nations):
                     percentAxis(axis)
                 else:
                     threeFigureAxis(axis)
-                axis.yaxis.set_major_locator(plt.MaxNLocator(3))
+                axis.yaxis.set_major_locator(tkr.MaxNLocator(3))
 
             ax.spines["top"].set_visible(False)
             ax2.spines["top"].set_visible(False)
@@ -755,7 +783,7 @@ def ComparisonNation(plotsDir, avg, t, data, nations):
             for axis in tertiary_ax:
                 axis.set_ylim(top=axMax[2])
 
-        plt.annotate(
+        ax3.annotate(
             "Note: Wales includes suspected COVID-19 patients in hospitalisation figures while the other nations include only confirmed cases.",
             xy=(0.25, 0.025),
             xycoords="figure fraction",
@@ -769,6 +797,9 @@ def lockdownVlines(ax):
     nationLockdownDates = [dt(2020, 3, 23), dt(2020, 11, 5), dt(2020, 12, 20)]
     nationLockdownEasing = [dt(2020, 7, 4), dt(2020, 12, 2), dt(2021, 7, 19)]
 
+    # the lockdowns don't count as data when dateAxis finds where the data ends
+    dataBounds = ax.dataLim.intervalx.copy()
+
     ymin, ymax = ax.get_ylim()
     for i, (x1, x2) in enumerate(zip(nationLockdownDates, nationLockdownEasing)):
         ax.axvspan(
@@ -788,93 +819,112 @@ def lockdownVlines(ax):
         ls="dashed",
         label="WHO declares pandemic",
     )
+    ax.dataLim.intervalx = dataBounds
+
+    ax.legend()
+
+
+nationTypes = [
+    {
+        "fileName": ".cases.reported",
+        "figname": "Nation-Cases-Reported",
+        "title": "COVID-19 cases by date reported",
+        "yLabel": "tested positive",
+    },
+    {
+        "fileName": ".deaths.reported",
+        "figname": "Nation-Deaths-Reported",
+        "title": "deaths within 4 weeks of a positive COVID-19 test by date reported",
+        "yLabel": "who have died within 28 days of a positive test",
+    },
+    {
+        "fileName": ".cases",
+        "skip": 5,
+        "figname": "Nation-Cases",
+        "title": "COVID-19 cases in UK Nations",
+        "yLabel": "tested positive",
+    },
+    {
+        "fileName": ".deaths",
+        "skip": 5,
+        "figname": "Nation-Deaths",
+        "title": "deaths within 4 weeks of a positive COVID-19 test",
+        "yLabel": "who have died within 28 days of a positive test",
+    },
+    {
+        "fileName": ".inHospital",
+        "figname": "Nation-inHospital",
+        "title": "patients in hospital with COVID-19",
+        "yLabel": "Patients in hospital with COVID-19",
+    },
+    {
+        "fileName": ".inVentilationBeds",
+        "figname": "Nation-Ventilation",
+        "title": "COVID-19 patients in mechanical ventilation beds by nation",
+        "yLabel": "who are in mechanical ventilation beds",
+    },
+    {
+        "fileName": ".vaccinations.weekly",
+        "figname": "Nation-Vaccinations",
+        "title": "COVID-19 vaccinations by nation",
+        "yLabel": "who have received vaccinations",
+    },
+]
+
+
+def nationMetrics(dataDir="data/", store=None):
+    """The MetricCache of the nationTypes files, by fileName, as frames with a column
+    per nation of nationPlot"""
+    nations = [nation["name"] for nation in nationColors]
+    skips = {figure["fileName"]: figure.get("skip", 0) for figure in nationTypes}
+
+    def load(name):
+        fileNames = [dataDir + nation + name + ".csv" for nation in nations]
+        series = readMany(fileNames, skip=skips[name], store=store)
+        return toFrame(*align(series), nations)
+
+    return metricCache(("nations", dataDir, store), load)
+
+
+nationColors = [
+    {"name": "England", "color": "#5694CA"},
+    {"name": "Northern Ireland", "color": "#FFDD00"},
+    {"name": "Scotland", "color": "#003078"},
+    {"name": "Wales", "color": "#D4351C"},
+]
+
+
+def nationPlot(
+    t, dataDir="data/", plotsDir="plots/", avg=True, store=None, figTypes=None
+):
+    """figTypes selects which of the types to plot by index, by default all of them"""
+    data = nationColors
 
-    plt.legend()
-
-
-def nationPlot(t, dataDir="data/", plotsDir="plots/", avg=True):
-    data = [
-        {"name": "England", "color": "#5694CA", "population": 56550138},
-        {"name": "Northern Ireland", "color": "#FFDD00", "population": 1895510},
-        {"name": "Scotland", "color": "#003078", "population": 5466000},
-        {"name": "Wales", "color": "#D4351C", "population": 3169586},
-    ]
-
-    totalPopulation = sum([x["population"] for x in data])
+    types = nationTypes
 
-    types = [
-        {
-            "fileName": ".cases.reported",
-            "figname": "Nation-Cases-Reported",
-            "title": "COVID-19 cases by date reported",
-            "yLabel": "tested positive",
-        },
-        {
-            "fileName": ".deaths.reported",
-            "figname": "Nation-Deaths-Reported",
-            "title": "deaths within 4 weeks of a positive COVID-19 test by date reported",
-            "yLabel": "who have died within 28 days of a positive test",
-        },
-        {
-            "fileName": ".cases",
-            "figname": "Nation-Cases",
-            "title": "COVID-19 cases in UK Nations",
-            "yLabel": "tested positive",
-        },
-        {
-            "fileName": ".deaths",
-            "figname": "Nation-Deaths",
-            "title": "deaths within 4 weeks of a positive COVID-19 test",
-            "yLabel": "who have died within 28 days of a positive test",
-        },
-        {
-            "fileName": ".inHospital",
-            "figname": "Nation-inHospital",
-            "title": "patients in hospital with COVID-19",
-            "yLabel": "Patients in hospital with COVID-19",
-        },
-        {
-            "fileName": ".inVentilationBeds",
-            "figname": "Nation-Ventilation",
-            "title": "COVID-19 patients in mechanical ventilation beds by nation",
-            "yLabel": "who are in mechanical ventilation beds",
-        },
-        {
-            "fileName": ".vaccinations.weekly",
-            "figname": "Nation-Vaccinations",
-            "title": "COVID-19 vaccinations by nation",
-            "yLabel": "who have received vaccinations",
-        },
-    ]
+    layout = template()
 
     iterations = len(types)
     if avg:
         iterations = len(types) - 1
 
-    for figType in range(iterations):
-        series = []
-        for i, nation in enumerate(data):
-            fileName = dataDir + nation["name"] + types[figType]["fileName"] + ".csv"
+    if figTypes is None:
+        figTypes = range(iterations)
 
-            if figType == 2 or figType == 3:
-                nationData = readData(fileName, type="dict", skip=5)
-            else:
-                nationData = readData(fileName, type="dict")
+    for figType in figTypes:
+        if figType >= iterations:
+            continue
 
-            nationSeries = pd.Series(nationData, name=nation["name"])
+        metrics = nationMetrics(dataDir, store)
+        name = types[figType]["fileName"]
+        steps = ["rolling"] if avg else []
 
-            if avg:
-                nationAvgSeries = pd.Series(
-                    n_day_avg(nationSeries),
-                    index=nationSeries.index,
-                    name=nation["name"],
-                )
-                series.append(nationAvgSeries)
-            else:
-                series.append(nationSeries)
+        frame = metrics.get(name, *steps)
+        dates = frame.index
 
-        df = pd.concat(series, axis=1)
-        dates = df.index
+        # nations by days
+        table = frame.to_numpy().T
+        perCapitaData = metrics.get(name, *steps, "perCapita").to_numpy().T
 
         fignameSuffix = ["", "-Per-Capita"]
         titleSuffix = ["", ", per capita"]
@@ -894,19 +944,17 @@ def nationPlot(t, dataDir="data/", plotsDir="plots/", avg=True):
             else:
                 title = types[figType]["title"] + titleSuffix[i]
             updateProgressBar(figname, t)
-            fig, ax = plt.subplots()
+            fig, ax = layout.begin()
             setTitle(ax, title)
 
-            bottom = [0] * len(df.index)
-
-            for nation in data:
-                plotData = df[nation["name"]]
+            bottoms = stackBottoms(table)
 
+            for j, nation in enumerate(data):
                 if perCapita[i]:
-                    plotData = [x / nation["population"] * 100 for x in plotData]
-                    ax.plot(
+                    layout.line(
+                        ax,
                         dates,
-                        plotData,
+                        perCapitaData[j],
                         color=nation["color"],
                         label=nation["name"],
                         linewidth=2,
@@ -914,21 +962,20 @@ def nationPlot(t, dataDir="data/", plotsDir="plots/", avg=True):
                 else:
                     ax.bar(
                         dates,
-                        plotData,
+                        table[j],
                         color=nation["color"],
                         label=nation["name"],
-                        bottom=bottom,
+                        bottom=bottoms[j],
                         width=barWidth,
                         align=alignment,
                     )
-                    bottom = list(map(add, plotData.fillna(0), bottom))
 
             if not perCapita[i]:
                 lockdownVlines(ax)
 
-            dateAxis(ax)
+            dateLimits(ax)
             if figType == len(types) - 1:
-                dateAxis(ax, left=dt(2020, 12, 1))
+                dateLimits(ax, left=dt(2020, 12, 1))
             handles, labels = ax.get_legend_handles_labels()
             ax.legend(reversed(handles), reversed(labels))
 
@@ -944,9 +991,6 @@ def nationPlot(t, dataDir="data/", plotsDir="plots/", avg=True):
             else:
                 threeFigureAxis(ax)
 
-            removeSpines(ax)
-            showGrid(ax)
-
             savePlot(plotsDir, figname, fig)
 
         if figType not in [4, 5]:
@@ -959,28 +1003,24 @@ def nationPlot(t, dataDir="data/", plotsDir="plots/", avg=True):
                         types[figType]["figname"] + "-Cumulative" + fignameSuffix[i]
                     )
                     updateProgressBar(figname, t)
-                    fig, ax = plt.subplots()
+                    fig, ax = layout.begin()
                     ax.set_title(
                         "Cumulative %s%s" % (types[figType]["title"], titleSuffix[i]),
                         fontweight="bold",
                     )
 
-                    bottom = [0] * len(df.index)
+                    # percent of the nation's or of the UK's population
+                    population = "perCapita" if perCapita[i] else ("perCapita", "UK")
+                    cumulativeData = metrics.get(name, population, "cumulative")
+                    cumulativeData = cumulativeData.to_numpy().T
+                    bottoms = stackBottoms(cumulativeData)
 
-                    for nation in data:
-                        reportedData = df[nation["name"]].fillna(0)
-                        if perCapita[i]:
-                            reportedData = [
-                                x / nation["population"] * 100 for x in reportedData
-                            ]
-                        else:
-                            reportedData = [
-                                x / totalPopulation * 100 for x in reportedData
-                            ]
-                        reportedData = np.cumsum(reportedData)
+                    for j, nation in enumerate(data):
+                        reportedData = cumulativeData[j]
 
                         if perCapita[i]:
-                            ax.plot(
+                            layout.line(
+                                ax,
                                 dates,
                                 reportedData,
                                 color=nation["color"],
@@ -993,16 +1033,14 @@ def nationPlot(t, dataDir="data/", plotsDir="plots/", avg=True):
                                 reportedData,
                                 color=nation["color"],
                                 label=nation["name"],
-                                bottom=bottom,
+                                bottom=bottoms[j],
                                 width=barWidth,
                                 align=alignment,
                             )
 
-                            bottom = list(map(add, reportedData, bottom))
-
-                    dateAxis(ax)
+                    dateLimits(ax)
                     if figType == len(types) - 1:
-                        dateAxis(ax, left=dt(2020, 12, 1))
+                        dateLimits(ax, left=dt(2020, 12, 1))
                     handles, labels = ax.get_legend_handles_labels()
                     ax.legend(reversed(handles), reversed(labels))
 
@@ -1013,44 +1051,28 @@ def nationPlot(t, dataDir="data/", plotsDir="plots/", avg=True):
                         avg,
                     )
 
-                    removeSpines(ax)
-                    showGrid(ax)
-
                     savePlot(plotsDir, figname, fig)
 
 
-def heatMapPlot(t, dataDir="data/", plotsDir="plots/"):
-    days = [
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ]
+# The areas of the UK and nation heat maps
+heatMapAreas = [["UK"], ["Scotland", "England", "Northern Ireland", "Wales"]]
+
+
+def heatMapPlot(t, dataDir="data/", plotsDir="plots/", groups=None):
+    """groups selects which of the UK and nation figures to plot, by default both"""
+    if groups is None:
+        groups = [0, 1]
+    areas = [nation for group in groups for nation in heatMapAreas[group]]
+    rollups = rollupMetrics(dataDir)
+    dayOfWeek = pd.concat([rollups.get(area + ".dayOfWeek") for area in areas])
 
     def getDataframes(name, fileNames):
-        data = []
+        """Mean of each day of the week up to the last full week"""
         dataFrames = []
 
         for fileName in fileNames:
-            data.append(readData(dataDir + name + fileName))
-
-        for dataSet in data:
-            df = pd.DataFrame(dataSet, columns=["Date", "Number"])
-            df.set_index("Date", inplace=True)
-            df.index = pd.to_datetime(df.index)
-            lastSunday = df["Number"].last_valid_index() - timedelta(
-                df["Number"].last_valid_index().isoweekday()
-            )
-            df = (
-                df[:lastSunday]
-                .groupby(df[:lastSunday].index.day_name())
-                .mean()
-                .reindex(days)
-            )
-            dataFrames.append(df)
+            means = dayOfWeek.loc[(name, fileName[1:-4]), days]
+            dataFrames.append(pd.DataFrame({"Number": means.astype(float)}, index=days))
 
         return dataFrames
 
@@ -1059,7 +1081,7 @@ def heatMapPlot(t, dataDir="data/", plotsDir="plots/"):
             ax.set_ylabel(name, rotation=0, ha="right", va="center")
 
         ax.bar(range(7), dataFrames["Number"], color=color)
-        ax.yaxis.set_major_locator(plt.MaxNLocator(2))
+        ax.yaxis.set_major_locator(tkr.MaxNLocator(2))
         threeFigureAxis(ax)
 
         removeSpines(ax, all=True)
@@ -1092,78 +1114,80 @@ def heatMapPlot(t, dataDir="data/", plotsDir="plots/"):
     for i, figtype in enumerate(types):
         title = "Comparison of average number of %s per day" % figtype["title"]
 
-        # UK
-        dataFrames = getDataframes("UK", figtype["fileNames"])
-
-        figname = "HeatMap-" + figtype["figname"]
-        updateProgressBar(figname, t)
-        fig, axs = plt.subplots(len(dataFrames), 1, sharex=True)
+        if 0 in groups:
+            dataFrames = getDataframes("UK", figtype["fileNames"])
 
-        if len(dataFrames) == 1:
-            plt.xticks(ticks=list(range(7)), labels=days)
+            figname = "HeatMap-" + figtype["figname"]
+            updateProgressBar(figname, t)
+            fig, axs = subplots(len(dataFrames), 1, sharex=True)
 
-            plotHeatmap(axs, figtype["yLabels"][0], dataFrames[0], figtype["colors"][0])
-        else:
-            for j, ax in enumerate(axs):
-                plt.xticks(ticks=list(range(7)), labels=days)
+            if len(dataFrames) == 1:
+                axs.set_xticks(list(range(7)), labels=days)
 
                 plotHeatmap(
-                    ax, figtype["yLabels"][j], dataFrames[j], figtype["colors"][j]
+                    axs, figtype["yLabels"][0], dataFrames[0], figtype["colors"][0]
                 )
+            else:
+                axs[-1].set_xticks(list(range(7)), labels=days)
 
-        fig.suptitle(title, fontweight="bold")
+                for j, ax in enumerate(axs):
+                    plotHeatmap(
+                        ax, figtype["yLabels"][j], dataFrames[j], figtype["colors"][j]
+                    )
 
-        savePlot(plotsDir, figname, fig)
+            fig.suptitle(title, fontweight="bold")
 
-        # Nations
-        figname = "HeatMap-" + figtype["figname"] + "-Nation"
-        updateProgressBar(figname, t)
+            savePlot(plotsDir, figname, fig)
 
-        nations = ["Scotland", "England", "Northern Ireland", "Wales"]
-        nationsDf = []
+        if 1 in groups:
+            figname = "HeatMap-" + figtype["figname"] + "-Nation"
+            updateProgressBar(figname, t)
 
-        for nation in nations:
-            nationDataFrame = getDataframes(nation, figtype["fileNames"])
+            nations = heatMapAreas[1]
+            nationsDf = []
 
-            nationsDf.append(nationDataFrame)
+            for nation in nations:
+                nationDataFrame = getDataframes(nation, figtype["fileNames"])
 
-        fig = plt.figure()
-        outerAxs = gridspec.GridSpec(2, 2, hspace=0.3)
+                nationsDf.append(nationDataFrame)
 
-        fig.suptitle(title + ", per nation", fontweight="bold")
+            fig = Figure()
+            outerAxs = fig.add_gridspec(2, 2, hspace=0.3)
 
-        for k in range(len(nationsDf)):
-            inner = outerAxs[k].subgridspec(len(nationsDf[0]), 1, hspace=0.3)
+            fig.suptitle(title + ", per nation", fontweight="bold")
 
-            axsRows = len(nationsDf[0])
+            for k in range(len(nationsDf)):
+                inner = outerAxs[k].subgridspec(len(nationsDf[0]), 1, hspace=0.3)
 
-            for j in range(axsRows):
-                ax = fig.add_subplot(inner[j])
-                if j == 0:
-                    ax.set_title(nations[k])
-                    ax.tick_params(
-                        axis="x", which="both", bottom=False, labelbottom=False
-                    )
-                elif j == axsRows - 1 and k > 1:
-                    plt.xticks(ticks=list(range(7)), labels=days)
-                else:
-                    ax.tick_params(
-                        axis="x", which="both", bottom=False, labelbottom=False
-                    )
+                axsRows = len(nationsDf[0])
 
-                plotHeatmap(
-                    ax,
-                    figtype["yLabels"][j],
-                    nationsDf[k][j],
-                    figtype["colors"][j],
-                    hide=k % 2,
-                )
-                fig.add_subplot(ax)
+                for j in range(axsRows):
+                    ax = fig.add_subplot(inner[j])
+                    if j == 0:
+                        ax.set_title(nations[k])
+                        ax.tick_params(
+                            axis="x", which="both", bottom=False, labelbottom=False
+                        )
+                    elif j == axsRows - 1 and k > 1:
+                        ax.set_xticks(list(range(7)), labels=days)
+                    else:
+                        ax.tick_params(
+                            axis="x", which="both", bottom=False, labelbottom=False
+                        )
+
+                    plotHeatmap(
+                        ax,
+                        figtype["yLabels"][j],
+                        nationsDf[k][j],
+                        figtype["colors"][j],
+                        hide=k % 2,
+                    )
+                    fig.add_subplot(ax)
 
-        savePlot(plotsDir, figname, fig, (17.5, 10))
+            savePlot(plotsDir, figname, fig, (17.5, 10))
 
 
-def timelinePlot(t, dataDir="data/", plotsDir="plots/"):
+def timelinePlot(t, dataDir="data/", plotsDir="plots/", store=None):
     """mask mandate
     NI [dt(2020, 9, 22), ?],"""
     data = [
@@ -1238,7 +1262,7 @@ def timelinePlot(t, dataDir="data/", plotsDir="plots/"):
 
     figname = "Timeline"
     updateProgressBar(figname, t)
-    fig, axs = plt.subplots(len(data), 1, constrained_layout=True)
+    fig, axs = subplots(len(data), 1, constrained_layout=True)
 
     for j, ax in enumerate(axs):
         ax.set_title(data[j]["name"])
@@ -1273,7 +1297,9 @@ def timelinePlot(t, dataDir="data/", plotsDir="plots/"):
         ax.set_yticks(range(len(keys)))
         ax.set_yticklabels(keys)
 
-        cases, casesDates = readFile(dataDir + data[j]["name"] + ".cases.csv", True)
+        cases, casesDates = readFile(
+            dataDir + data[j]["name"] + ".cases.csv", True, store
+        )
         ax2 = ax.twinx()
         ax2.plot_date(casesDates[:-5], cases[:-5], "orangered")
         ymin, ymax = ax2.get_ylim()
@@ -1283,7 +1309,9 @@ def timelinePlot(t, dataDir="data/", plotsDir="plots/"):
         ax2.set_ylim(bottom=ymin, top=ymax)
         ax2.axes.yaxis.set_visible(False)
 
-        deaths, deathDates = readFile(dataDir + data[j]["name"] + ".deaths.csv", True)
+        deaths, deathDates = readFile(
+            dataDir + data[j]["name"] + ".deaths.csv", True, store
+        )
         ax3 = ax.twinx()
         ax3.plot_date(deathDates[:-5], deaths[:-5], "#333")
         ymin, ymax = ax3.get_ylim()
@@ -1311,11 +1339,16 @@ def timelinePlot(t, dataDir="data/", plotsDir="plots/"):
     savePlot(plotsDir, figname, fig, size=(10, 16))
 
 
+# The England.<type>.demographics.csv files demographicsPlot reads
+demographics = ["cases", "deaths"]
+
+
 def demographicsPlot(t, dataDir="data/", plotsDir="plots/"):
-    types = ["cases", "deaths"]
-    for figType in types:
+    layout = template()
+
+    for figType in demographics:
         df = pd.read_csv(
-            "data/England." + figType + ".demographics.csv",
+            dataDir + "England." + figType + ".demographics.csv",
             index_col=[0, 1],
             usecols=[0, 5, 6],
             parse_dates=True,
@@ -1400,18 +1433,22 @@ def demographicsPlot(t, dataDir="data/", plotsDir="plots/"):
                         title += ", per capita"
 
                     updateProgressBar(figname, t)
-                    fig, ax = plt.subplots()
+                    fig, ax = layout.begin()
 
                     for label, col in df.iterrows():
                         if perCapBool:
                             col = col.apply(lambda row: row / populations[label] * 100)
 
                         if cumBool:
-                            ax.plot(
-                                col.index.get_level_values(1), col.cumsum(), label=label
+                            layout.line(
+                                ax,
+                                col.index.get_level_values(1),
+                                col.cumsum(),
+                                label=label,
                             )
                         else:
-                            ax.plot(
+                            layout.line(
+                                ax,
                                 col.index.get_level_values(1),
                                 col.rolling(7).mean(),
                                 label=label,
@@ -1421,7 +1458,7 @@ def demographicsPlot(t, dataDir="data/", plotsDir="plots/"):
 
                     lockdownVlines(ax)
 
-                    dateAxis(ax)
+                    dateLimits(ax)
                     handles, labels = ax.get_legend_handles_labels()
                     ax.legend(reversed(handles), reversed(labels))
 
@@ -1440,36 +1477,261 @@ def demographicsPlot(t, dataDir="data/", plotsDir="plots/"):
                     else:
                         threeFigureAxis(ax)
 
-                    removeSpines(ax)
-                    showGrid(ax)
-
                     savePlot(plotsDir, figname, fig)
 
 
 # Helpers ------------------------------------------------------------------------------
+def plotTasks(dataDir="data/", plotsDir="plots/", store=None):
+    """Every figure as independent groups of (function, args, kwargs, inputs), the
+    longest first, where inputs are the data files the group reads"""
+    nationList = [["UK"], ["Scotland", "England", "Northern Ireland", "Wales"]]
+    nations = nationList[1]
+
+    tasks = []
+    for avg in [False, True]:
+        for group in [0, 1]:
+            suffix = ".avg.csv" if avg else ".csv"
+            inputs = [dataDir + nation + suffix for nation in nationList[group]]
+            inputs += [
+                dataDir + nation + ".deaths.excess.csv" for nation in nationList[group]
+            ]
+
+            kwargs = {"avg": avg, "store": store, "groups": [group]}
+            tasks.append((mainPlot, (dataDir, plotsDir), kwargs, inputs))
+
+    for avg in [False, True]:
+        for figType, figure in enumerate(nationTypes):
+            fileName = figure["fileName"] + ".csv"
+            inputs = [dataDir + nation + fileName for nation in nations]
+
+            kwargs = {"avg": avg, "store": store, "figTypes": [figType]}
+            tasks.append((nationPlot, (dataDir, plotsDir), kwargs, inputs))
+
+    inputs = [dataDir + "England.%s.demographics.csv" % name for name in demographics]
+    tasks.append((demographicsPlot, (dataDir, plotsDir), {}, inputs))
+
+    inputs = rollupFiles(dataDir, weeklyIncreaseRollups, ["UK"])
+    tasks.append((weeklyIncreasePlot, (dataDir, plotsDir), {}, inputs))
+
+    for group, areas in enumerate(heatMapAreas):
+        inputs = rollupFiles(dataDir, ["dayOfWeek"], areas)
+        tasks.append((heatMapPlot, (dataDir, plotsDir), {"groups": [group]}, inputs))
+
+    inputs = [dataDir + nation + ".cases.csv" for nation in nations]
+    inputs += [dataDir + nation + ".deaths.csv" for nation in nations]
+    tasks.append((timelinePlot, (dataDir, plotsDir), {"store": store}, inputs))
+
+    return tasks
+
+
+# Source files that every figure depends on besides its data
+codeFiles = [
+    "plot.py",
+    "columnStore.py",
+    "dayAxis.py",
+    "derivedMetrics.py",
+    "readData.py",
+    "rollingKernels.py",
+    "rollup.py",
+    "tidySVG.py",
+]
+
+
+def plotChanged(t, tasks, plotsDir="plots/", jobs=1, pool="process", rebuild=False):
+    """Renders the groups of tasks whose inputs have changed since they were last
+    drawn, or all of them if rebuild is set. plotsDir/.manifest.json records the hash
+    of the inputs of every figure written. Those are its data files and the code in
+    codeFiles, as the date axes end with the data"""
+    manifest = Manifest(plotsDir + ".manifest.json")
+    figures = manifest.get("figures", {})
+
+    codeDir = os.path.dirname(os.path.abspath(__file__))
+    code = [hashFile(os.path.join(codeDir, name)) for name in codeFiles]
+    code.append(matplotlib.__version__)
+
+    hashes = {}
+    changed = []
+    for function, args, kwargs, inputs in tasks:
+        group = function.__name__ + "".join(
+            " %s=%s" % (name, value)
+            for name, value in sorted(kwargs.items())
+            if name != "store"
+        )
+
+        for fileName in inputs:
+            if fileName not in hashes:
+                isFile = os.path.isfile(fileName)
+                hashes[fileName] = hashFile(fileName) if isFile else ""
+
+        key = [group, code, [(name, hashes[name]) for name in inputs]]
+        inputsHash = hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+        drawn = [name for name, entry in figures.items() if entry["group"] == group]
+        unchanged = drawn and all(
+            figures[name]["inputs"] == inputsHash and os.path.isfile(plotsDir + name)
+            for name in drawn
+        )
+
+        if unchanged and not rebuild:
+            t.update(len(drawn))
+        else:
+            task = (plotGroup, (function, args, kwargs), {})
+            changed.append((group, inputsHash, task))
+
+    def record(i, fileNames):
+        group, inputsHash, _ = changed[i]
+        for name in [name for name in figures if figures[name]["group"] == group]:
+            del figures[name]
+        for fileName in fileNames:
+            name = os.path.relpath(fileName, plotsDir).replace(os.sep, "/")
+            figures[name] = {"group": group, "inputs": inputsHash}
+        manifest.set(figures=figures)
+
+    render(t, [task for _, _, task in changed], jobs, pool, record)
+
+
+# Files written by savePlot in the current plotGroup call of each thread
+saved = threading.local()
+
+
+def plotGroup(t, function, args, kwargs):
+    """Calls function(t, *args, **kwargs) and returns the files it saved"""
+    saved.fileNames = []
+    function(t, *args, **kwargs)
+    return saved.fileNames
+
+
 def updateProgressBar(figname, t):
     t.update()
     t.set_description(figname)
 
 
+def subplots(*args, constrained_layout=False, **kwargs):
+    """pyplot.subplots for a Figure that isn't registered with pyplot, so that figures
+    can be built in several threads at once"""
+    fig = Figure(constrained_layout=constrained_layout)
+    return fig, fig.subplots(*args, **kwargs)
+
+
+# Templates of each layout for the current thread
+templates = threading.local()
+
+
+def template(nrows=1, ncols=1, **kwargs):
+    """The Template of the subplots(nrows, ncols, **kwargs) layout for this thread"""
+    if not hasattr(templates, "layouts"):
+        templates.layouts = {}
+
+    key = (nrows, ncols, tuple(sorted(kwargs.items())))
+    if key not in templates.layouts:
+        templates.layouts[key] = Template(nrows, ncols, **kwargs)
+    return templates.layouts[key]
+
+
+class Template:
+    """A figure with date x axes that is built and styled once and then drawn again for
+    each figure of its layout. begin() removes the previous figure and line() updates
+    its lines with set_data instead of plotting new ones. Bars, fills and lockdown lines
+    depend on each figure's data and limits so they are drawn as usual"""
+
+    def __init__(self, nrows=1, ncols=1, **kwargs):
+        self.fig, self.axs = subplots(nrows, ncols, **kwargs)
+        self.axes = list(np.ravel(self.axs))
+
+        # (line, style) in the order line() was called on each axes
+        self.lines = [[] for ax in self.axes]
+        self.drawn = [0] * len(self.axes)
+
+        for ax in self.axes:
+            removeSpines(ax)
+            showGrid(ax)
+            dateTicks(ax)
+
+    def begin(self):
+        """Returns the figure and axes, as subplots does, without the artists, legends,
+        twin axes, titles, labels and y limits and ticks of the previous figure"""
+        for ax in self.fig.axes:
+            if ax not in self.axes:
+                self.fig.delaxes(ax)
+
+        for i, ax in enumerate(self.axes):
+            if ax.get_legend():
+                ax.get_legend().remove()
+
+            for artists in [ax.containers, ax.collections, ax.patches, ax.lines]:
+                for artist in list(artists):
+                    artist.remove()
+            for artists in [ax.texts, ax.images, ax.artists]:
+                for artist in list(artists):
+                    artist.remove()
+
+            ax.relim()
+            ax.autoscale()
+            ax.set_prop_cycle(None)
+
+            ax.xaxis.reset_ticks()
+            ax.yaxis.reset_ticks()
+            ax.yaxis.set_major_locator(tkr.AutoLocator())
+            ax.yaxis.set_major_formatter(tkr.ScalarFormatter())
+
+            ax.set_title("")
+            ax.set_xlabel("")
+            ax.set_ylabel("", color=matplotlib.rcParams["axes.labelcolor"])
+
+            self.drawn[i] = 0
+
+        return self.fig, self.axs
+
+    def line(self, ax, x, y, **kwargs):
+        """ax.plot(x, y, **kwargs), reusing the line drawn in the same order on ax in the
+        previous figure if it had the same style"""
+        i = self.axes.index(ax)
+        n = self.drawn[i]
+        self.drawn[i] += 1
+
+        if "color" not in kwargs:
+            colors = matplotlib.rcParams["axes.prop_cycle"].by_key()["color"]
+            kwargs["color"] = colors[n % len(colors)]
+
+        style = sorted((k, v) for k, v in kwargs.items() if k not in ["color", "label"])
+
+        lines = self.lines[i]
+        if n < len(lines) and lines[n][1] == style:
+            line = lines[n][0]
+            line.set_data(x, y)
+            line.set_color(kwargs["color"])
+            line.set_label(kwargs.get("label", "_child%d" % n))
+            ax.add_line(line)
+            return line
+
+        (line,) = ax.plot(x, y, **kwargs)
+        if n < len(lines):
+            lines[n] = (line, style)
+        else:
+            lines.append((line, style))
+        return line
+
+
 def savePlot(plotsDir, figname, fig, size=()):
     if size:
-        plt.gcf().set_size_inches(*size)
+        fig.set_size_inches(*size)
     else:
-        plt.gcf().set_size_inches(12, 8)
+        fig.set_size_inches(12, 8)
 
     if False:
         fileName = plotsDir + "png/" + figname
-        plt.savefig(fileName, bbox_inches="tight", pad_inches=0.25, dpi=200)
+        fig.savefig(fileName, bbox_inches="tight", pad_inches=0.25, dpi=200)
     else:
         fileName = plotsDir + "svg/" + figname + ".svg"
-        plt.savefig(
-            fileName, bbox_inches="tight", pad_inches=0.25, dpi=200, format="svg"
-        )
-        tidySVG(fileName)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, bbox_inches="tight", pad_inches=0.25, dpi=200, format="svg")
+        with open(fileName, "wb") as file:
+            file.write(tidySVGBytes(buffer.getvalue()))
+
+    if hasattr(saved, "fileNames"):
+        saved.fileNames.append(fileName)
 
     # mpld3.save_json(fig, "d3/" + figname + ".json")
-    plt.close(fig)
 
 
 def removeSpines(ax, all=False):
@@ -1539,19 +1801,38 @@ def setYLabel(ax, label, avg, color="black", ax2=False):
 
 
 # X axis
-def dateAxis(ax, year=False, left=dt(2020, 3, 1), right=dt.today(), skip_dates=True):
-    ax.set_xlim(left=left, right=right)
+def dateAxis(ax, year=False, left=dt(2020, 3, 1), right=None, skip_dates=True):
+    ax.set_xlim(left=left, right=dataEnd(ax) if right is None else right)
     if year:
         ax.set_xlim(left=left, right=dt(2021, 3, 1))
 
+    dateTicks(ax)
+    
+    if skip_dates:
+        reduceXlabels(ax, every_nth=2)
+
+
+def dateTicks(ax):
     ax.xaxis.set_major_locator(MonthLocator())
     ax.xaxis_date()
     ax.xaxis.set_major_formatter(df("%d %b"))
-    
+
+
+def dateLimits(ax, left=dt(2020, 3, 1), right=None, skip_dates=True):
+    """dateAxis for a Template, which already has its date ticks"""
+    ax.set_xlim(left=left, right=dataEnd(ax) if right is None else right)
+
     if skip_dates:
         reduceXlabels(ax, every_nth=2)
 
 
+def dataEnd(ax):
+    """The last date drawn on ax or the axes sharing its x axis, so that a figure only
+    depends on its data. None if nothing has been drawn"""
+    end = max(other.dataLim.x1 for other in ax.get_shared_x_axes().get_siblings(ax))
+    return end if np.isfinite(end) else None
+
+
 def reduceXlabels(ax, every_nth=3):
     for n, label in enumerate(ax.xaxis.get_ticklabels()):
         if n % every_nth != 0:
@@ -1559,20 +1840,28 @@ def reduceXlabels(ax, every_nth=3):
 
 
 def reduceYlabels(ax, max=6):
-    ax.yaxis.set_major_locator(plt.MaxNLocator(max))
+    ax.yaxis.set_major_locator(tkr.MaxNLocator(max))
 
 
 # Math
+def stackBottoms(table):
+    """Bottom of each row of a bar chart stacking the rows of a table, the sum of the
+    rows before it with NaN as 0"""
+    bottoms = np.zeros(table.shape)
+    np.cumsum(np.where(np.isnan(table), 0, table)[:-1], axis=0, out=bottoms[1:])
+    return bottoms
+
+
 def n_day_avg(xs, n=7):
     """compute n day average of time series, using maximum possible number of days at
     start of series"""
-    return [np.mean(xs[max(0, i + 1 - n) : i + 1]) for i in range(xs.shape[0])]
+    return rollingMean(xs, n)
 
 
 def n_day_sum(xs, n=28):
     """compute n day sum of time series, using maximum possible number of days at
     start of series"""
-    return [np.sum(xs[max(0, i + 1 - n) : i + 1]) for i in range(xs.shape[0])]
+    return rollingSum(xs, n)
 
 
 def decimalPlaces(number, digits):
@@ -1598,10 +1887,49 @@ def defineArgParser():
         "-f", "--force", help="Get data even if it is not new", action="store_true"
     )
 
+    parser.add_argument(
+        "--full",
+        help="Replace the whole history of each data file rather than the last few days "
+        + "and reprocess all of it",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-s",
+        "--store",
+        help="Read the data through a columnar store in <dataDir>/store/",
+        action="store_true",
+    )
+
     parser.add_argument(
         "-t", "--test", help="Plot even if there is no new data", action="store_true"
     )
 
+    parser.add_argument(
+        "-r",
+        "--rebuild",
+        help="Plot every figure, even those whose inputs haven't changed since they "
+        + "were last plotted",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of processes or threads to plot in [default: 1]",
+        default=1,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--pool",
+        help="Plot in processes, which read the data through the columnar store, or in "
+        + "threads, which share the data in memory [default: process]",
+        choices=["process", "thread"],
+        default="process",
+        type=str,
+    )
+
     parser.add_argument(
         "-D",
         "--dataDir",
@@ -1643,23 +1971,33 @@ if __name__ == "__main__":
 
     newData = False
     if not clArgs.dryrun:
-        newData = getData(dataDir, clArgs.force)
+        newData = getData(dataDir, clArgs.force, full=clArgs.full)
 
     if newData or clArgs.test or clArgs.dryrun:
-        processData()
+        store = None
+        if clArgs.store or (clArgs.jobs > 1 and clArgs.pool == "process"):
+            store = dataDir + "store/"
+            importData(dataDir, store)
+
+        processData(dataDir, store, full=clArgs.full)
+        rollup(dataDir)
+
+        if store:
+            # mapped before forking so that the workers share the pages
+            openStore(store)
 
         t = tqdm(
             total=94, bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} {elapsed_s:.1f}s"
         )
 
-        bools = [False, True]
-        for bool in bools:
-            mainPlot(t, dataDir, plotsDir, avg=bool)
-            nationPlot(t, dataDir, plotsDir, avg=bool)
-
-        demographicsPlot(t, dataDir, plotsDir)
-        heatMapPlot(t, dataDir, plotsDir)
-        timelinePlot(t, dataDir, plotsDir)
+        plotChanged(
+            t,
+            plotTasks(dataDir, plotsDir, store),
+            plotsDir,
+            clArgs.jobs,
+            clArgs.pool,
+            clArgs.rebuild,
+        )
 
         t.close()
     else:
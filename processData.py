@@ -1,77 +1,170 @@
 import argparse
-from readData import readData
+import os
+from concurrent.futures import ProcessPoolExecutor
+from readData import readMany
+from columnStore import frameSeries, importData, writeMetrics
+from dayAxis import align, toFrame
+from derivedMetrics import MetricCache, derived
 import pandas as pd
 import numpy as np
 
 
-def processData(dataDir="data/"):
-    fileNames = [
-        ".testing.reported.csv",
-        ".cases.reported.csv",
-        ".cases.csv",
-        ".deaths.reported.csv",
-        ".deaths.csv",
-        ".deaths.onCertificate.csv",
-        ".hospitalisations.csv",
-        ".inHospital.csv"
-    ]
-
-    names = [
-        "reportedTests",
-        "reportedCases",
-        "specimenCases",
-        "reportedDeaths",
-        "specimenDeaths",
-        "certificateDeaths",
-        "hospitalisations",
-        "inHospital",
-    ]
-
-    nationList = ["UK", "Scotland", "England", "Northern Ireland", "Wales"]
-
-    for nation in nationList:
-        nationSeries = []
-        for i, fileName in enumerate(fileNames):
-            fileName = dataDir + nation + fileName
-            if i in [2, 4]:
-                data = readData(fileName, type="dict", skip=5)
-            elif fileName == ".deaths.onCertificate.csv":
-                data = readData(fileName, type="dict", skip=11)
-            else:
-                data = readData(fileName, type="dict")
-            series = pd.Series(data, name=names[i])
-            nationSeries.append(series)
-
-        nationData = pd.concat(nationSeries, axis=1)
-
-        calculateFeatures(nationData)
-
-        nationData.to_csv(dataDir + nation + ".csv")
-
-        for column in names:
-            nationData[column].loc[
-                nationData[column].first_valid_index() : nationData[column].last_valid_index()
-            ].fillna(0, inplace=True)
-            nationData[column] = nationData[column].rolling(7).mean()
-
-        calculateFeatures(nationData)
-
-        nationData.to_csv(dataDir + nation + ".avg.csv")
+fileNames = [
+    ".testing.reported.csv",
+    ".cases.reported.csv",
+    ".cases.csv",
+    ".deaths.reported.csv",
+    ".deaths.csv",
+    ".deaths.onCertificate.csv",
+    ".hospitalisations.csv",
+    ".inHospital.csv"
+]
+
+names = [
+    "reportedTests",
+    "reportedCases",
+    "specimenCases",
+    "reportedDeaths",
+    "specimenDeaths",
+    "certificateDeaths",
+    "hospitalisations",
+    "inHospital",
+]
+
+# specimen date files are incomplete for the last five days
+skips = [5 if i in [2, 4] else 0 for i in range(len(fileNames))]
+
+# rows of input each output row depends on, the 28 day sum of the 7 day average
+lookback = 7 + 28 - 1
+
+
+def processData(dataDir="data/", store=None, jobs=1, areas=None, full=False):
+    """If store is given the inputs are read from that columnStore directory and the
+    outputs are written to it as well as to the csv files. If jobs is more than one that
+    many areas are processed at once in separate processes. Every area is attempted
+    before the failures are reported, in the order of areas.
+
+    Unless full is set only the rows affected by changed inputs are recomputed, see
+    processArea"""
+    if areas is None:
+        areas = ["UK", "Scotland", "England", "Northern Ireland", "Wales"]
+
+    results = {}
+    errors = {}
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            futures = {
+                area: executor.submit(processArea, area, dataDir, store, full)
+                for area in areas
+            }
+            for area, future in futures.items():
+                try:
+                    results[area] = future.result()
+                except Exception as error:
+                    errors[area] = error
+    else:
+        for area in areas:
+            try:
+                results[area] = processArea(area, dataDir, store, full)
+            except Exception as error:
+                errors[area] = error
+
+    # the store is shared by every area so it is only written from here
+    if store:
+        series = {}
+        for area, (nationData, avgData) in results.items():
+            series.update(frameSeries("processed.", area, nationData))
+            series.update(frameSeries("processed.avg.", area, avgData))
+        writeMetrics(store, series)
+
+    if errors:
+        for area, error in errors.items():
+            print("Failed to process %s: %r" % (area, error))
+        raise RuntimeError(
+            "Failed to process " + ", ".join(errors)
+        ) from next(iter(errors.values()))
+
+
+def processArea(nation, dataDir="data/", store=None, full=False):
+    """Writes <nation>.csv and <nation>.avg.csv, returning both frames.
+
+    Unless full is set the inputs are compared with the copy of them kept in the
+    existing <nation>.csv. Only the rows from the first that differs are recomputed,
+    from the lookback rows before it, and spliced onto the existing outputs. Rolling
+    sums of non-integer values can then differ from a full rebuild in the last digit"""
+    inputs = readMany(
+        [dataDir + nation + fileName for fileName in fileNames], skip=skips, store=store
+    )
 
+    nationData = toFrame(*align(inputs), names)
 
-def calculateFeatures(nationData):
-    nationData["posTests"] = nationData.apply(
-        lambda row: min(row["reportedCases"] / row["reportedTests"] * 100, 100), axis=1,
-    )
+    outputs = [dataDir + nation + ".csv", dataDir + nation + ".avg.csv"]
+    if not full and all(os.path.isfile(fileName) for fileName in outputs):
+        old = [
+            pd.read_csv(
+                fileName, index_col=0, parse_dates=True, float_precision="round_trip"
+            ).astype(np.float64)
+            for fileName in outputs
+        ]
+        if all(list(frame.columns[: len(names)]) == names for frame in old):
+            return updateArea(nationData, old, outputs, names)
 
-    nationData["mortCases"] = nationData["reportedCases"].rolling(28).sum()
+    calculateFeatures(nationData)
+
+    nationData.to_csv(dataDir + nation + ".csv")
+
+    avgData = nationData.copy()
+    avgData[names] = avgData[names].rolling(7).mean()
+
+    calculateFeatures(avgData)
+
+    avgData.to_csv(dataDir + nation + ".avg.csv")
+
+    return nationData, avgData
+
+
+def updateArea(nationData, old, outputs, names):
+    """Recomputes the outputs from the first row of nationData that differs from the
+    inputs stored in old[0], leaving the files untouched if nothing has changed"""
+    change = firstChange(old[0][names], nationData)
+    if change == len(nationData) == len(old[0]):
+        return tuple(old)
+
+    start = max(0, change - lookback)
+    recent = nationData.iloc[start:].copy()
+
+    calculateFeatures(recent)
+    avgRecent = recent.copy()
+    avgRecent[names] = avgRecent[names].rolling(7).mean()
+    calculateFeatures(avgRecent)
+
+    frames = []
+    for oldData, newData, fileName in zip(old, [recent, avgRecent], outputs):
+        frame = pd.concat([oldData.iloc[:change], newData.iloc[change - start :]])
+        frame.to_csv(fileName)
+        frames.append(frame)
+
+    return tuple(frames)
 
-    nationData["mortality"] = nationData.apply(
-        lambda row: min(row["specimenDeaths"] / row["mortCases"] * 100, 100), axis=1
-    )
-    nationData["hospitalisationRate"] = nationData.apply(
-        lambda row: min(row["hospitalisations"] / row["mortCases"] * 100, 100), axis=1,
-    )
+
+def firstChange(old, new):
+    """Position of the first row of new that differs from old in date or values"""
+    n = min(len(old), len(new))
+    oldValues = old.to_numpy()[:n]
+    newValues = new.to_numpy()[:n]
+
+    same = (oldValues == newValues) | (np.isnan(oldValues) & np.isnan(newValues))
+    same = same.all(axis=1) & (old.index[:n] == new.index[:n])
+
+    differ = np.flatnonzero(~same)
+    return differ[0] if len(differ) else n
+
+
+def calculateFeatures(nationData):
+    """Adds the metrics derived from the inputs, as declared in derivedMetrics"""
+    metrics = MetricCache(lambda name: nationData[name])
+    for name in derived:
+        nationData[name] = metrics.get(name)
 
 
 def defineArgParser():
@@ -88,6 +181,27 @@ def defineArgParser():
         type=str,
     )
 
+    parser.add_argument(
+        "-s",
+        "--store",
+        help="Also keep the data in a columnar store in <dataDir>/store/",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of areas to process at once [default: 1]",
+        default=1,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--full",
+        help="Rebuild every output rather than the rows affected by new data",
+        action="store_true",
+    )
+
     return parser
 
 
@@ -95,4 +209,9 @@ if __name__ == "__main__":
     argParser = defineArgParser()
     clArgs = argParser.parse_args()
 
-    processData(clArgs.dataDir)
+    store = None
+    if clArgs.store:
+        store = clArgs.dataDir + "store/"
+        importData(clArgs.dataDir, store)
+
+    processData(clArgs.dataDir, store, clArgs.jobs, full=clArgs.full)
@@ -1,10 +1,96 @@
 import csv
 import argparse
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt
 
+import numpy as np
 
-def readData(fileName, type="arr", skip=0):
-    if type == "arr":
+from columnStore import readDates
+
+# parsed files by (fileName, type, skip, store), least recently used first
+cache = OrderedDict()
+cacheLock = threading.Lock()
+cacheStats = {"hits": 0, "misses": 0, "size": 0, "maxSize": 64 * 1024 * 1024}
+
+
+def readData(fileName, type="arr", skip=0, store=None):
+    """type "np" returns a datetime64[D] array of dates and an int64 array of values,
+    float64 if they aren't integers. If store is given the rows of fileName are read
+    from that columnStore directory instead of the csv.
+
+    Results are cached until the file changes, np arrays are returned read only and
+    lists and dicts as copies so the cached result can't be modified"""
+    key = (fileName, type, skip, store)
+    stat = os.stat(os.path.join(store, "meta.json") if store else fileName)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    with cacheLock:
+        entry = cache.get(key)
+        if entry and entry[0] == stamp:
+            cache.move_to_end(key)
+            cacheStats["hits"] += 1
+            return copyData(entry[1])
+        cacheStats["misses"] += 1
+
+    data = parseData(fileName, type, skip, store)
+    if type == "np":
+        for array in data:
+            array.flags.writeable = False
+
+    size = dataSize(data)
+    with cacheLock:
+        if key in cache:
+            cacheStats["size"] -= cache.pop(key)[2]
+        if size <= cacheStats["maxSize"]:
+            cache[key] = (stamp, data, size)
+            cacheStats["size"] += size
+        while cacheStats["size"] > cacheStats["maxSize"]:
+            cacheStats["size"] -= cache.popitem(last=False)[1][2]
+
+    return copyData(data)
+
+
+def setCacheSize(maxSize):
+    """Sets the memory the cache may use in bytes, 0 disables it"""
+    with cacheLock:
+        cacheStats["maxSize"] = maxSize
+        while cacheStats["size"] > maxSize:
+            cacheStats["size"] -= cache.popitem(last=False)[1][2]
+
+
+def cacheInfo():
+    with cacheLock:
+        return {**cacheStats, "entries": len(cache)}
+
+
+def copyData(data):
+    if isinstance(data, list):
+        return [list(row) for row in data]
+    elif isinstance(data, dict):
+        return dict(data)
+    return data
+
+
+def dataSize(data):
+    """Approximate memory used by a result in bytes"""
+    if isinstance(data, tuple):
+        return sum(array.nbytes for array in data)
+    elif data is None:
+        return 0
+    # a row is roughly a list, a date and an int
+    return len(data) * 150
+
+
+def parseData(fileName, type, skip, store):
+    if store is not None:
+        return readStored(fileName, type, skip, store)
+
+    if type == "np":
+        return readArrays(fileName, skip)
+    elif type == "arr":
         with open(fileName, "r") as file:
             reader = csv.reader(file, delimiter=",")
             fileData = []
@@ -27,6 +113,89 @@ def readData(fileName, type="arr", skip=0):
     return None
 
 
+def readMany(fileNames, type="np", skip=0, store=None, jobs=8):
+    """Reads each file with readData on a thread pool, returning the results in the
+    same order. skip is either one value for every file or a list of one per file"""
+    if isinstance(skip, int):
+        skip = [skip] * len(fileNames)
+
+    with ThreadPoolExecutor(jobs) as executor:
+        return list(
+            executor.map(
+                lambda args: readData(args[0], type, args[1], store),
+                zip(fileNames, skip),
+            )
+        )
+
+
+def readArrays(fileName, skip=0):
+    """Parses the dates and first value column of a file in bulk, empty values are 0.
+    Rows are "YYYY-MM-DD,value[,...]" so the fields are found and converted with array
+    operations on the raw bytes rather than row by row"""
+    with open(fileName, "rb") as file:
+        raw = np.frombuffer(file.read().replace(b"\r", b""), dtype=np.uint8)
+    if len(raw) and raw[-1] != ord("\n"):
+        raw = np.append(raw, np.uint8(ord("\n")))
+
+    ends = np.flatnonzero(raw == ord("\n"))
+    starts = np.concatenate(([0], ends[:-1] + 1))[: len(ends)]
+    if skip:
+        starts, ends = starts[:-skip], ends[:-skip]
+    if not len(starts):
+        return np.empty(0, dtype="datetime64[D]"), np.empty(0, dtype=np.int64)
+
+    digits = raw[starts[:, None] + np.arange(10)].astype(np.int64) - ord("0")
+    years = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    months = digits[:, 5] * 10 + digits[:, 6]
+    days = digits[:, 8] * 10 + digits[:, 9]
+    dates = ((years - 1970) * 12 + months - 1).astype("datetime64[M]")
+    dates = dates.astype("datetime64[D]") + (days - 1)
+
+    # the value runs from after the date to the next comma or the end of the line
+    commas = np.append(np.flatnonzero(raw == ord(",")), len(raw))
+    valueStarts = starts + 11
+    valueEnds = np.minimum(commas[np.searchsorted(commas, valueStarts)], ends)
+    lengths = np.maximum(valueEnds - valueStarts, 0)
+
+    width = max(int(lengths.max()), 1)
+    positions = np.minimum(valueStarts[:, None] + np.arange(width), len(raw) - 1)
+    inValue = np.arange(width) < lengths[:, None]
+    chars = np.where(inValue, raw[positions], ord("0")).astype(np.int64)
+
+    negative = chars[:, 0] == ord("-")
+    chars[:, 0] = np.where(negative, ord("0"), chars[:, 0])
+    if ((chars < ord("0")) | (chars > ord("9"))).any():
+        values = [
+            bytes(raw[start:end]).decode() or "0"
+            for start, end in zip(valueStarts, valueEnds)
+        ]
+        return dates, np.array(values).astype(np.float64)
+
+    powers = 10 ** np.maximum(lengths[:, None] - 1 - np.arange(width), 0)
+    values = ((chars - ord("0")) * powers * inValue).sum(axis=1)
+    values = np.where(negative, -values, values)
+
+    return dates, values
+
+
+def readStored(fileName, type, skip, store):
+    area, metric = os.path.basename(fileName)[: -len(".csv")].split(".", 1)
+    dates, values = readDates(store, metric, area, skip)
+
+    if type == "np":
+        if np.all(values == np.floor(values)):
+            values = values.astype(np.int64)
+        return dates, values
+    elif type == "arr":
+        return [[str(date), int(value)] for date, value in zip(dates, values)]
+    elif type == "dict":
+        return {
+            dt.fromisoformat(str(date)): int(value) for date, value in zip(dates, values)
+        }
+
+    return None
+
+
 def defineArgParser():
     """Creates parser for command line arguments"""
     parser = argparse.ArgumentParser(
@@ -37,6 +206,14 @@ def defineArgParser():
         "fileName", help="Name of the file that should be read", type=str,
     )
 
+    parser.add_argument(
+        "-s",
+        "--store",
+        help="Read the file from this columnStore directory",
+        default=None,
+        type=str,
+    )
+
     return parser
 
 
@@ -44,4 +221,4 @@ if __name__ == "__main__":
     argParser = defineArgParser()
     clArgs = argParser.parse_args()
 
-    print(readData(clArgs.fileName))
+    print(readData(clArgs.fileName, store=clArgs.store))
@@ -0,0 +1,108 @@
+"""Renders independent groups of figures in a pool of worker processes or threads.
+Processes are forked from the plotting process, so they start with matplotlib imported,
+the fonts registered and the memory-mapped columnStore already open. Threads share the
+data read by the plotting process as it is. Either reports each figure back to the
+progress bar through a queue"""
+import multiprocessing
+import queue
+import sys
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+# the ProgressProxy of a worker process
+progress = None
+
+
+class ProgressProxy:
+    """Stands in for the tqdm bar in a worker, forwarding the calls plot makes on it so
+    that only the main thread of the plotting process draws the bar"""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def update(self, n=1):
+        self.messages.put(("update", (n,)))
+
+    def set_description(self, desc):
+        self.messages.put(("set_description", (desc,)))
+
+    def refresh(self):
+        pass
+
+
+def initWorker(messages):
+    global progress
+    progress = ProgressProxy(messages)
+
+    # the rich progress bar redirects the streams through its console, whose lock
+    # another thread may have held when the worker was forked
+    sys.stdout = sys.__stdout__
+    sys.stderr = sys.__stderr__
+
+
+def renderTask(function, args, kwargs):
+    return function(progress, *args, **kwargs)
+
+
+def render(t, tasks, jobs=1, pool="process", done=None):
+    """Calls function(t, *args, **kwargs) for each (function, args, kwargs) in tasks,
+    in jobs worker processes, or threads if pool is "thread", if jobs is more than one.
+    Tasks should be ordered longest first so the last ones to start are short. If
+    given, done(i, result) is called in this thread as each task i succeeds. The first
+    error of any task is raised once all of them have finished"""
+    if jobs == 1:
+        for i, (function, args, kwargs) in enumerate(tasks):
+            result = function(t, *args, **kwargs)
+            if done:
+                done(i, result)
+        return
+
+    if pool == "thread":
+        messages = queue.Queue()
+        proxy = ProgressProxy(messages)
+        executor = ThreadPoolExecutor(jobs)
+
+        def submit(function, args, kwargs):
+            return executor.submit(function, proxy, *args, **kwargs)
+
+    else:
+        context = multiprocessing.get_context("fork")
+        messages = context.Queue()
+        executor = ProcessPoolExecutor(
+            jobs, mp_context=context, initializer=initWorker, initargs=(messages,)
+        )
+
+        def submit(function, args, kwargs):
+            return executor.submit(renderTask, function, args, kwargs)
+
+    with executor:
+        futures = [submit(*task) for task in tasks]
+
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            forward(t, messages)
+
+            for future in finished:
+                if done and not future.exception():
+                    done(futures.index(future), future.result())
+
+    # the workers have finished, so everything they queued can be read
+    forward(t, messages)
+
+    for future in futures:
+        future.result()
+
+
+def forward(t, messages):
+    """Applies the queued progress messages to t"""
+    while True:
+        try:
+            name, args = messages.get_nowait()
+        except queue.Empty:
+            return
+        getattr(t, name)(*args)
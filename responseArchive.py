@@ -0,0 +1,136 @@
+"""Append-only archive of raw API responses, one compressed file per day, so that the
+data can be re-processed without fetching it again"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ResponseArchive:
+    """Each record is a JSON header line, giving the url, headers and size of the
+    body, followed by the body. Records are appended as separate gzip members or zstd
+    frames, which decompress as one stream"""
+
+    def __init__(self, archiveDir, compression="gzip"):
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+
+        self.archiveDir = archiveDir
+        self.compression = compression
+        self.lock = threading.Lock()
+
+        os.makedirs(archiveDir, exist_ok=True)
+
+    def fileName(self, day=None):
+        extension = ".gz" if self.compression == "gzip" else ".zst"
+        day = day or date.today()
+        return os.path.join(self.archiveDir, day.isoformat() + ".csv" + extension)
+
+    def tee(self, url, headers, lines):
+        """Yields lines while spooling them to disk, the response is appended to the
+        archive once every line has been consumed"""
+        with tempfile.TemporaryFile() as body:
+            for line in lines:
+                body.write(line.encode("utf-8") + b"\n")
+                yield line
+
+            header = {
+                "url": url,
+                "time": time.time(),
+                "headers": {
+                    key: headers[key]
+                    for key in ["Last-Modified", "ETag", "Content-Encoding"]
+                    if key in headers
+                },
+                "size": body.tell(),
+            }
+            body.seek(0)
+            self.append(header, body)
+
+    def append(self, header, body):
+        with self.lock, open(self.fileName(), "ab") as file:
+            if self.compression == "gzip":
+                out = gzip.GzipFile(fileobj=file, mode="wb")
+            else:
+                out = zstandard.ZstdCompressor().stream_writer(file, closefd=False)
+
+            with out:
+                out.write(json.dumps(header).encode("utf-8") + b"\n")
+                shutil.copyfileobj(body, out)
+
+
+def readArchive(fileName):
+    """Yields the header and body of each record in an archive file"""
+    with open(fileName, "rb") as file:
+        if fileName.endswith(".zst"):
+            stream = zstandard.ZstdDecompressor().stream_reader(
+                file, read_across_frames=True
+            )
+        else:
+            stream = gzip.GzipFile(fileobj=file, mode="rb")
+
+        with stream:
+            while True:
+                line = readLine(stream)
+                if not line:
+                    break
+                header = json.loads(line)
+                yield header, stream.read(header["size"])
+
+
+def readLine(stream):
+    # zstd streams have no readline
+    line = b""
+    while not line.endswith(b"\n"):
+        char = stream.read(1)
+        if not char:
+            break
+        line += char
+    return line
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "fileName", help="Archive file to read", type=str,
+    )
+
+    parser.add_argument(
+        "-u",
+        "--url",
+        help="Print the body of the last response for this url",
+        default=None,
+        type=str,
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    body = None
+    for header, recordBody in readArchive(clArgs.fileName):
+        if clArgs.url is None:
+            fetched = time.strftime("%H:%M:%S", time.localtime(header["time"]))
+            print(fetched, "%9d" % header["size"], header["url"])
+        elif header["url"] == clArgs.url:
+            body = recordBody
+
+    if body is not None:
+        print(body.decode("utf-8"), end="")
@@ -0,0 +1,81 @@
+"""Rolling sums and means along the last axis of 1-D arrays or (areas, days) tables,
+computed in O(n) from differences of cumulative sums. Windows at the start of a series
+use as many values as are available. Integer valued data, which is all the data files
+hold, is summed in int64 so every window total is exact"""
+import numpy as np
+
+# how NaN values are treated: a window containing one is NaN, they are left out of the
+# window, or they count as 0
+nanPolicies = ["propagate", "omit", "zero"]
+
+
+def rollingSum(values, n=28, nan="propagate"):
+    """Sum of each value and the n - 1 before it. Integer arrays give int64 sums
+    unless a window is NaN"""
+    values = np.asarray(values)
+    sums, counts = windowTotals(values, n, nan)
+
+    if sums.dtype.kind == "i" and values.dtype.kind in "iub":
+        return sums
+
+    sums = sums.astype(np.float64)
+    sums[counts == 0] = np.nan
+    return sums
+
+
+def rollingMean(values, n=7, nan="propagate"):
+    """Mean of each value and the n - 1 before it"""
+    sums, counts = windowTotals(np.asarray(values), n, nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return sums.astype(np.float64) / counts
+
+
+def windowTotals(values, n, nan="propagate"):
+    """The total of each window and the number of values in it, 0 for windows that
+    are NaN under the nan policy"""
+    if nan not in nanPolicies:
+        raise ValueError("nan must be one of " + ", ".join(nanPolicies))
+
+    days = values.shape[-1]
+    counts = np.minimum(np.arange(1, days + 1), n)
+
+    missing = None
+    if values.dtype.kind == "f":
+        missing = np.isnan(values)
+        if missing.any():
+            values = np.where(missing, 0, values)
+        else:
+            missing = None
+
+    # integer valued floats are summed as integers, as float cumulative sums would round
+    if values.dtype.kind in "iub" or isIntegral(values):
+        values = values.astype(np.int64)
+
+    sums = windowed(values, n)
+
+    if missing is not None and nan != "zero":
+        missingCounts = windowed(missing.astype(np.int64), n)
+        if nan == "propagate":
+            counts = np.where(missingCounts > 0, 0, counts)
+        else:
+            counts = counts - missingCounts
+        sums = np.where(counts == 0, 0, sums)
+
+    return sums, np.broadcast_to(counts, sums.shape)
+
+
+def isIntegral(values):
+    """True if every value of a float array is an integer small enough to be exact"""
+    return bool(
+        values.size
+        and np.all(values == np.trunc(values))
+        and np.abs(values).max() < 2 ** 53
+    )
+
+
+def windowed(values, n):
+    """Sum of each expanding-start window of n along the last axis"""
+    sums = np.cumsum(values, axis=-1)
+    if n < values.shape[-1]:
+        sums[..., n:] -= sums[..., :-n].copy()
+    return sums
@@ -0,0 +1,184 @@
+"""Weekly sums, week over week change, day of week means and monthly totals of every
+metric of every area. Each metric is aligned into one areas by days array and
+aggregated in a single pass, then stored next to the processed data as
+data/<area>.rollup.<kind>.csv for the plots to read, so that a figure of one area only
+depends on that area's files"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from dayAxis import align
+from derivedMetrics import metricCache
+from getData import metrics
+from processData import fileNames, names, skips
+from readData import readMany
+
+days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+kinds = ["weekly", "dayOfWeek", "monthly"]
+
+areas = ["UK", "Scotland", "England", "Northern Ireland", "Wales"]
+
+
+def rollup(dataDir="data/", areas=areas):
+    """Writes the rollups of the per metric files, by file name, and of the inputs of
+    processData, by column name with the same rows skipped"""
+
+    sources = [(name, "." + name + ".csv", 0) for name in metrics]
+    sources += [
+        (name, fileName, skip)
+        for name, fileName, skip in zip(names, fileNames, skips)
+        if name not in metrics
+    ]
+
+    tables = {kind: [] for kind in kinds}
+    for metric, fileName, skip in sources:
+        inputs = readMany([dataDir + area + fileName for area in areas], skip=skip)
+        first, table, present = align(inputs)
+        if first is None:
+            continue
+
+        for kind, frame in rollupTable(first, table).items():
+            frame.insert(0, "metric", metric)
+            frame.insert(0, "area", [areas[i] for i in frame.pop("row")])
+            tables[kind].append(frame)
+
+    for kind in kinds:
+        table = pd.concat(tables[kind])
+        for area in areas:
+            fileName = rollupFiles(dataDir, [kind], [area])[0]
+            table[table["area"] == area].to_csv(fileName, index=False)
+
+
+def rollupTable(first, table):
+    """Aggregates a rows by days table starting on first. Each row covers the weeks and
+    months from its first to its last value, as resampling it would. The day of week
+    means use the days up to lastSunday, the Sunday before the last value"""
+    dates = first + np.arange(table.shape[1])
+    weekdays = (dates.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+
+    valid = ~np.isnan(table)
+    values = np.where(valid, table, 0)
+    rows = np.flatnonzero(valid.any(axis=1))
+    firstDay = valid.argmax(axis=1)
+    lastDay = table.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+
+    # weeks run Monday to Sunday and are labelled by the Sunday
+    weekStarts = np.flatnonzero(weekdays == 0)
+    if weekdays[0] != 0:
+        weekStarts = np.concatenate(([0], weekStarts))
+    weekSums = np.add.reduceat(values, weekStarts, axis=1)
+    weekEnds = dates[weekStarts] + (6 - weekdays[weekStarts])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weekChange = weekSums[:, 1:] / weekSums[:, :-1] - 1
+
+    months = dates.astype("datetime64[M]")
+    monthStarts = np.flatnonzero(np.concatenate(([True], months[1:] != months[:-1])))
+    monthTotals = np.add.reduceat(values, monthStarts, axis=1)
+
+    cutoff = lastDay - (weekdays[lastDay] + 1)
+    beforeCutoff = valid & (np.arange(table.shape[1]) <= cutoff[:, None])
+    dayTotals = np.stack(
+        [(values * (beforeCutoff & (weekdays == k))).sum(axis=1) for k in range(7)], 1
+    )
+    dayCounts = np.stack(
+        [(beforeCutoff & (weekdays == k)).sum(axis=1) for k in range(7)], 1
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dayMeans = dayTotals / dayCounts
+
+    weekly = []
+    monthly = []
+    for row in rows:
+        start, end = np.searchsorted(weekStarts, [firstDay[row], lastDay[row]], "right")
+        change = np.concatenate(([np.nan], weekChange[row, start - 1 : end - 1]))
+        weekly.append(
+            pd.DataFrame(
+                {
+                    "row": row,
+                    "week": weekEnds[start - 1 : end],
+                    "sum": weekSums[row, start - 1 : end],
+                    "change": change,
+                }
+            )
+        )
+
+        start, end = np.searchsorted(monthStarts, [firstDay[row], lastDay[row]], "right")
+        monthly.append(
+            pd.DataFrame(
+                {
+                    "row": row,
+                    "month": months[monthStarts[start - 1 : end]],
+                    "total": monthTotals[row, start - 1 : end],
+                }
+            )
+        )
+
+    dayOfWeek = pd.DataFrame(dayMeans[rows], columns=days)
+    dayOfWeek.insert(0, "lastSunday", first + cutoff[rows])
+    dayOfWeek.insert(0, "row", rows)
+
+    return {
+        "weekly": pd.concat(weekly),
+        "dayOfWeek": dayOfWeek,
+        "monthly": pd.concat(monthly),
+    }
+
+
+def readRollup(dataDir="data/", kinds=kinds, areas=areas):
+    """Returns the rollups of the given kinds and areas by kind, indexed by area and
+    metric"""
+    dates = {"weekly": ["week"], "dayOfWeek": ["lastSunday"], "monthly": ["month"]}
+    return {
+        kind: pd.concat(
+            pd.read_csv(
+                fileName,
+                index_col=["area", "metric"],
+                parse_dates=dates[kind],
+                float_precision="round_trip",
+            )
+            for fileName in rollupFiles(dataDir, [kind], areas)
+        ).sort_index()
+        for kind in kinds
+    }
+
+
+def rollupMetrics(dataDir="data/"):
+    """The MetricCache of the rollups of dataDir, by "<area>.<kind>\""""
+
+    def load(name):
+        area, kind = name.rsplit(".", 1)
+        return readRollup(dataDir, [kind], [area])[kind]
+
+    return metricCache(("rollups", dataDir), load)
+
+
+def rollupFiles(dataDir="data/", kinds=kinds, areas=areas):
+    return [
+        dataDir + area + ".rollup." + kind + ".csv" for kind in kinds for area in areas
+    ]
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "-D",
+        "--dataDir",
+        help="Directory where the csv files are stored [default: data/]",
+        default="data/",
+        type=str,
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    rollup(clArgs.dataDir)
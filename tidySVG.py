@@ -1,17 +1,75 @@
+"""Removes the width and height of the root element of SVGs so that they scale to
+their container. Run as a script to tidy every SVG in a directory"""
+import argparse
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+
+
+def tidySVGBytes(contents):
+    """Returns the bytes of an SVG without the width and height of its root element"""
+    root = re.search(rb"^<svg.*", contents, re.MULTILINE)
+    if not root:
+        return contents
+
+    line = root.group()
+    line = re.sub(rb"^(<svg.*?)height=.*? (.*$)", rb"\1\2", line)
+    line = re.sub(rb"^(<svg.*?)width=.*? (.*$)", rb"\1\2", line)
+
+    return contents[: root.start()] + line + contents[root.end() :]
+
 
 def tidySVG(filename):
-    with open(filename, "r") as r:
-        contents = r.readlines()
-
-    for i, line in enumerate(contents):
-        if re.match(r"^<svg", line):
-            withoutH = re.sub(r"^(<svg.*?)height=.*? (.*$)", r"\1\2", line)
-            withoutW = re.sub(r"^(<svg.*?)width=.*? (.*$)", r"\1\2", withoutH)
-            contents[i] = withoutW
-            break
-
-    
-    with open(filename, "w") as w:
-        w.writelines(contents)
-            
\ No newline at end of file
+    with open(filename, "rb") as r:
+        contents = r.read()
+
+    tidied = tidySVGBytes(contents)
+    if tidied != contents:
+        with open(filename, "wb") as w:
+            w.write(tidied)
+
+
+def tidyDirectory(directory="plots/svg/", jobs=1):
+    """Tidies every SVG in directory, in jobs threads"""
+    fileNames = [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.endswith(".svg")
+    ]
+
+    with ThreadPoolExecutor(jobs) as executor:
+        list(executor.map(tidySVG, fileNames))
+
+    return len(fileNames)
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "directory",
+        help="Directory of the SVGs to tidy [default: plots/svg/]",
+        nargs="?",
+        default="plots/svg/",
+        type=str,
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of threads to tidy in [default: 1]",
+        default=1,
+        type=int,
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    tidyDirectory(clArgs.directory, clArgs.jobs)
@@ -0,0 +1,188 @@
+"""Store of every published vintage of the data files. Each row is kept once for as
+long as its value is unchanged, with the release that published it and the release
+that superseded it, so storage grows with the number of revisions and any vintage is
+one indexed query"""
+import argparse
+import os
+import sqlite3
+import time
+
+
+class VintageStore:
+    """Releases are identified by their publication date, YYYY-MM-DD, which sorts
+    chronologically as text. Values are the text of a row after its date, so a vintage
+    of a file is rebuilt exactly"""
+
+    def __init__(self, fileName):
+        self.connection = sqlite3.connect(fileName)
+        with self.connection:
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS rows (
+                    area TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    published TEXT NOT NULL,
+                    superseded TEXT
+                );
+                CREATE INDEX IF NOT EXISTS byDate
+                    ON rows (area, metric, date, published);
+                CREATE INDEX IF NOT EXISTS current
+                    ON rows (area, metric) WHERE superseded IS NULL;
+                CREATE TABLE IF NOT EXISTS releases (
+                    published TEXT PRIMARY KEY,
+                    recorded REAL NOT NULL
+                );
+                """
+            )
+
+    def record(self, published, area, metric, rows):
+        """Records rows, a dict of date: value, as the vintage published on that date,
+        returning the number of rows that changed. Rows missing from it are treated as
+        removed"""
+        current = {
+            date: (value, rowid)
+            for date, value, rowid in self.connection.execute(
+                "SELECT date, value, rowid FROM rows "
+                + "WHERE area = ? AND metric = ? AND superseded IS NULL",
+                (area, metric),
+            )
+        }
+
+        superseded = [
+            (published, rowid)
+            for date, (value, rowid) in current.items()
+            if rows.get(date) != value
+        ]
+        added = [
+            (area, metric, date, value, published)
+            for date, value in rows.items()
+            if date not in current or current[date][0] != value
+        ]
+
+        self.connection.executemany(
+            "UPDATE rows SET superseded = ? WHERE rowid = ?", superseded
+        )
+        self.connection.executemany(
+            "INSERT INTO rows (area, metric, date, value, published) "
+            + "VALUES (?, ?, ?, ?, ?)",
+            added,
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO releases VALUES (?, ?)", (published, time.time())
+        )
+
+        return len(superseded) + len(added)
+
+    def recordFiles(self, published, dataDir, names):
+        """Records dataDir/<name>.csv for each <area>.<metric> in names in one
+        transaction, returning the number of rows that changed"""
+        changed = 0
+        with self.connection:
+            for name in names:
+                fileName = dataDir + name + ".csv"
+                if not os.path.isfile(fileName):
+                    continue
+
+                with open(fileName) as file:
+                    rows = dict(
+                        line.split(",", 1) for line in file.read().splitlines() if line
+                    )
+
+                area, metric = name.split(".", 1)
+                changed += self.record(published, area, metric, rows)
+
+        return changed
+
+    def value(self, area, metric, date, asOf):
+        """The value of metric on date as published on asOf, None if it wasn't"""
+        row = self.connection.execute(
+            "SELECT value FROM rows WHERE area = ? AND metric = ? AND date = ? "
+            + "AND published <= ? AND (superseded IS NULL OR superseded > ?)",
+            (area, metric, date, asOf, asOf),
+        ).fetchone()
+        return row[0] if row else None
+
+    def vintage(self, area, metric, asOf):
+        """The (date, value) rows of metric as published on asOf, oldest first"""
+        return self.connection.execute(
+            "SELECT date, value FROM rows WHERE area = ? AND metric = ? "
+            + "AND published <= ? AND (superseded IS NULL OR superseded > ?) "
+            + "ORDER BY date",
+            (area, metric, asOf, asOf),
+        ).fetchall()
+
+    def revisions(self, area, metric, date):
+        """The (published, value) of each revision of metric on date"""
+        return self.connection.execute(
+            "SELECT published, value FROM rows "
+            + "WHERE area = ? AND metric = ? AND date = ? ORDER BY published",
+            (area, metric, date),
+        ).fetchall()
+
+    def releases(self):
+        return [
+            published
+            for (published,) in self.connection.execute(
+                "SELECT published FROM releases ORDER BY published"
+            )
+        ]
+
+    def close(self):
+        self.connection.close()
+
+
+def defineArgParser():
+    """Creates parser for command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+
+    parser.add_argument(
+        "name", help="File to print, as <area>.<metric>", nargs="?", type=str,
+    )
+
+    parser.add_argument(
+        "-a",
+        "--asOf",
+        help="Print the vintage published on this date [default: the latest]",
+        default="9999-12-31",
+        type=str,
+    )
+
+    parser.add_argument(
+        "-d",
+        "--date",
+        help="Print every revision of the value on this date instead",
+        default=None,
+        type=str,
+    )
+
+    parser.add_argument(
+        "-D",
+        "--dataDir",
+        help="Directory where the csv files are stored [default: data/]",
+        default="data/",
+        type=str,
+    )
+
+    return parser
+
+
+if __name__ == "__main__":
+    argParser = defineArgParser()
+    clArgs = argParser.parse_args()
+
+    store = VintageStore(clArgs.dataDir + "vintages.db")
+
+    if clArgs.name is None:
+        print("\n".join(store.releases()))
+    else:
+        area, metric = clArgs.name.split(".", 1)
+        if clArgs.date:
+            for published, value in store.revisions(area, metric, clArgs.date):
+                print(published, value)
+        else:
+            for date, value in store.vintage(area, metric, clArgs.asOf):
+                print(date + "," + value)